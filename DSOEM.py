@@ -6,33 +6,312 @@ Package: fqakg
 Author: Jose Ortiz
         Eduard Kegulskiy
 """
+import atexit
+import hashlib
+import json
 import math
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+import numpy as np
 from data_source.google_kg_client.GKGAPI import GKGAPI
 from data_source.sfsu_diffbot.sfsu_diffbot_client import *
 import logging
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urlsplit
 from os.path import splitext
 from QPM import QuestionType
 from colorama import init
 init() # colorama needed for Windows
 from colorama import Fore, Back, Style
+from qa_logging import Highlight, get_logger
+
+logger = get_logger("DSOEM")
+
+
+class QueryYieldStats(object):
+    """
+    Statistics of the search queries sent by DSOEM: number of calls, new valid objects added and latency, per query
+    type (Full+, POS-based, ...) and question shape (see DSOEM.question_shape). They can be persisted to a JSON file,
+    so that they are learned across runs
+    """
+
+    def __init__(self, path=None):
+        """
+        :param path: optional JSON file the statistics are loaded from and saved to
+        """
+        self._path = path
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._stats = {}
+        # questions whose outcomes were recorded since the last save, and whether anything changed since then
+        self._unsaved_questions = 0
+        self._dirty = False
+        if path is not None and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self._stats = json.load(f)
+
+    @staticmethod
+    def key(query_type, shape):
+        return "{}|{}".format(query_type, shape)
+
+    def record(self, query_type, shape, num_objects, latency):
+        """
+            records one search API call
+        :param query_type: type of the query
+        :param shape: shape of the question
+        :param num_objects: number of new valid objects the query added
+        :param latency: duration of the call in seconds
+        :return: None
+        """
+        with self._lock:
+            entry = self._stats.setdefault(QueryYieldStats.key(query_type, shape),
+                                           {'calls': 0, 'objects': 0, 'empty_calls': 0, 'latency': 0.0})
+            entry['calls'] += 1
+            entry['objects'] += num_objects
+            entry['latency'] += latency
+            if num_objects == 0:
+                entry['empty_calls'] += 1
+            self._dirty = True
+
+    def get(self, query_type, shape):
+        """
+        :return: statistics of the query type for the question shape, None if it was never recorded
+        """
+        with self._lock:
+            entry = self._stats.get(QueryYieldStats.key(query_type, shape))
+            return dict(entry) if entry is not None else None
+
+    def is_low_yield(self, query_type, shape, min_calls, min_yield):
+        """
+        :return: True if the query type was sent at least min_calls times for the question shape and added less than
+                 min_yield new valid objects per call on average
+        """
+        entry = self.get(query_type, shape)
+        return entry is not None and entry['calls'] >= min_calls and entry['objects'] / entry['calls'] < min_yield
+
+    def explore(self, query_type, shape, explore_every):
+        """
+            counts a low-yield query type passed over for the question shape
+        :param explore_every: a low-yield query type is sent anyway once every explore_every questions, so that its
+                              statistics keep being updated. None never sends it
+        :return: True if the query type is sent anyway for this question
+        """
+        if explore_every is None:
+            return False
+        with self._lock:
+            entry = self._stats[QueryYieldStats.key(query_type, shape)]
+            entry['passed_over'] = entry.get('passed_over', 0) + 1
+            self._dirty = True
+            if entry['passed_over'] >= explore_every:
+                entry['passed_over'] = 0
+                return True
+            return False
+
+    def plan(self, query_types, shape, policy, min_calls, min_yield, explore_every=None):
+        """
+            orders the queries of a question according to the pruning policy
+        :param query_types: types of the queries, in rank order
+        :param shape: shape of the question
+        :param policy: None (send all queries in rank order), "defer" (send low-yield queries after the others) or
+                       "skip" (don't send low-yield queries). The first query is always sent first
+        :param min_calls: see is_low_yield
+        :param min_yield: see is_low_yield
+        :param explore_every: see explore, low-yield queries explored are sent in rank order
+        :return: indexes of the queries to send in order, and indexes of the low-yield queries
+        """
+        if policy is None:
+            return list(range(len(query_types))), []
+
+        low_yield = [index for index, query_type in enumerate(query_types)
+                     if index > 0 and self.is_low_yield(query_type, shape, min_calls, min_yield) and
+                     not self.explore(query_type, shape, explore_every)]
+        others = [index for index in range(len(query_types)) if index not in low_yield]
+        if policy == "skip":
+            return others, low_yield
+        elif policy == "defer":
+            return others + low_yield, low_yield
+        raise Exception("Unrecognized query pruning policy {}".format(policy))
+
+    def report(self):
+        """
+        :return: lines describing the statistics, sorted by question shape and query type
+        """
+        lines = []
+        with self._lock:
+            for key in sorted(self._stats, key=lambda k: tuple(reversed(k.split("|", 1)))):
+                entry = self._stats[key]
+                query_type, shape = key.split("|", 1)
+                lines.append("{:<35} {:<12} calls={:<6} objects/call={:6.2f} empty={:6.1%} latency={:8.1f}ms".format(
+                    shape, query_type, entry['calls'], entry['objects'] / entry['calls'],
+                    entry['empty_calls'] / entry['calls'], entry['latency'] / entry['calls'] * 1000))
+        return lines
+
+    def question_done(self, save_every):
+        """
+            counts a question whose query outcomes were recorded, saving the statistics every save_every questions
+        :return: None
+        """
+        with self._lock:
+            self._unsaved_questions += 1
+            due = self._unsaved_questions >= save_every
+        if due:
+            self.save()
+
+    def save(self):
+        """
+            writes the statistics to the file if they changed since the last save
+        :return: None
+        """
+        if self._path is None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            # the file is written outside of the statistics lock, so that recording is not blocked by the write
+            content = json.dumps(self._stats, indent=1, sort_keys=True)
+            self._dirty = False
+            self._unsaved_questions = 0
+        with self._save_lock:
+            with open(self._path, "w", encoding='utf-8') as f:
+                f.write(content)
+
+
+class NearDuplicateFilter(object):
+    """
+    Detects near-duplicate documents, such as mirrors and syndicated copies of an article, by the SimHash fingerprints
+    of their word shingles. Two documents are near duplicates if their 64-bit fingerprints agree on at least the
+    similarity fraction of their bits
+    """
+
+    def __init__(self, similarity, shingle_size, paragraph_size):
+        """
+        :param similarity: fraction of the fingerprint bits near duplicates agree on
+        :param shingle_size: number of words of the shingles
+        :param paragraph_size: maximum number of tokens of the candidate answer paragraphs of a document, to estimate
+                               the paragraphs of the near duplicates
+        """
+        self._max_distance = int((1 - similarity) * 64)
+        self._shingle_size = shingle_size
+        self._paragraph_size = paragraph_size
+        self._fingerprints = []
+        self.documents = 0
+        self.paragraphs = 0
+
+    @staticmethod
+    def fingerprint(text, shingle_size):
+        """
+        :param text: text of a document
+        :param shingle_size: number of words of the shingles
+        :return: 64-bit SimHash fingerprint of the set of word shingles of the text
+        """
+        words = re.findall(r'\w+', text.lower())
+        shingles = {" ".join(words[i:i + shingle_size]) for i in range(max(1, len(words) - shingle_size + 1))}
+        hashes = np.array([int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+                           for shingle in shingles], dtype=np.uint64)
+        # bit i of the fingerprint is set if bit i is set in the hashes of most shingles
+        bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+        majority = bits.sum(axis=0) * 2 > len(shingles)
+        return int(np.packbits(majority, bitorder='little').view('<u8')[0])
+
+    def add(self, object):
+        """
+            adds a document, unless it is a near duplicate of a document added before
+        :param object: data source object
+        :return: False if the object is a near duplicate, it is counted in documents and its estimated number of
+                 candidate answer paragraphs in paragraphs
+        """
+        fingerprint = NearDuplicateFilter.fingerprint(object.text(), self._shingle_size)
+        for other in self._fingerprints:
+            if bin(fingerprint ^ other).count("1") <= self._max_distance:
+                self.documents += 1
+                self.paragraphs += math.ceil(object.text_stats().tokens / self._paragraph_size)
+                return False
+        self._fingerprints.append(fingerprint)
+        return True
+
 
 class DSOEM(object):
     """
     DSOEM will take as input the set of multiple queries gerenated by FMQFM module, and return high quality objects
     from the selected Data Source
     """
-
-    def __init__(self, mqfm, kg_instance="dkg", api_key = None, qpm=None):
+    #####################################################################################################
+    # CONFIGURABLE PARAMETERS
+    # optional JSON file with the yield statistics of the search queries (see QueryYieldStats)
+    QUERY_STATS_FILE = None
+    # what to do with query types which rarely add valid objects for the shape of the question: None (send all
+    # queries), "defer" (send them last, so they are not sent if the other queries collect enough objects) or "skip"
+    QUERY_PRUNING = None
+    # a query type is low-yield for a question shape after QUERY_MIN_CALLS calls which added less than QUERY_MIN_YIELD
+    # new valid objects per call on average
+    QUERY_MIN_CALLS = 20
+    QUERY_MIN_YIELD = 0.5
+    # a low-yield query type is still sent once every QUERY_EXPLORE_EVERY questions of the shape, so that its yield
+    # statistics can recover from a bad sample. None never sends it
+    QUERY_EXPLORE_EVERY = 10
+    # the yield statistics are saved to QUERY_STATS_FILE every QUERY_STATS_SAVE_EVERY questions, and at exit
+    QUERY_STATS_SAVE_EVERY = 20
+    # optional JSON lines file the outcome of every query is appended to, to be replayed by
+    # benchmark.py --bench=query-yield
+    QUERY_LOG_FILE = None
+    # number of search queries of a question sent to the data source at the same time: the one processed and the next
+    # ones, sent ahead while objects are still missing. 1 sends them one by one
+    MAX_CONCURRENT_QUERIES = 2
+    # adaptive paging (Diffbot): a query first asks for QUERY_PAGE_SIZE documents, or for the documents needed to reach
+    # the object limit at the valid object yield of the queries processed when it is sent if more, and for more (up to
+    # the object limit) only while the valid objects collected are short of the limit. It receives fewer response bytes
+    # but sends more search API calls, and takes more round trips, than asking for the object limit at once (None)
+    QUERY_PAGE_SIZE = None
+    # tag expansion: also collect the articles of the tags of the objects found, whose URI contains a query term
+    TAG_EXPANSION = False
+    # per question, at most TAG_EXPANSION_MAX_URIS tag articles are fetched, highest tag scores first, at most
+    # TAG_EXPANSION_MAX_CONCURRENT at a time and within TAG_EXPANSION_MAX_SECONDS
+    TAG_EXPANSION_MAX_URIS = 10
+    TAG_EXPANSION_MAX_CONCURRENT = 4
+    TAG_EXPANSION_MAX_SECONDS = 5.0
+    # objects whose text is a near duplicate of the text of an object collected before are dropped (see
+    # NearDuplicateFilter), near duplicates agree on at least NEAR_DUPLICATE_SIMILARITY of their fingerprint bits (0.95
+    # catches mirrors and syndicated copies). None keeps them
+    NEAR_DUPLICATE_SIMILARITY = None
+    NEAR_DUPLICATE_SHINGLE_SIZE = 4
+    # maximum size in word tokens of FAESM's candidate answer paragraphs (FAESM.ANSWER_PARAGRAPH_MAX_SIZE), to estimate
+    # the paragraphs of the near duplicates dropped
+    NEAR_DUPLICATE_PARAGRAPH_SIZE = 200
+    #####################################################################################################
+
+    # number of search API calls not sent because of QUERY_PRUNING
+    skipped_query_calls = 0
+    # number of tag articles fetched, and of the fetches not done within TAG_EXPANSION_MAX_SECONDS
+    tag_fetches = 0
+    tag_fetches_timed_out = 0
+    # search API calls and response bytes, and the ones saved compared to asking for the object limit with each query
+    search_calls = 0
+    search_calls_saved = 0
+    response_bytes = 0
+    response_bytes_saved = 0
+    # number of near-duplicate objects dropped, and of the candidate answer paragraphs FAESM would have built from them
+    # (their tokens over NEAR_DUPLICATE_PARAGRAPH_SIZE, rounded up)
+    near_duplicate_documents = 0
+    near_duplicate_paragraphs = 0
+
+    _query_stats = None
+    _query_stats_lock = threading.Lock()
+
+    def __init__(self, mqfm, kg_instance="dkg", api_key = None, qpm=None, stream=False):
         """
             DSOEM constructor
         :param mqfm: FMQFM object
         :param kg_instance: data source kg object (supported values are 'dkg' and 'gkg' - representing Diffbot and Google KG)
         :param api_key: api token to be used when calling data source APIs
-        :param qpm: QPM object
+        :param qpm: QPM object or QPMResult
+        :param stream: don't collect the objects of the search queries in the constructor, but as iter_objects is
+                       consumed
         """
-        print("")
-        self.log("{}MODULE 3: DATA SOURCE OBJECT EXTRACTION MODULE{}".format(Style.BRIGHT, Style.RESET_ALL))
+        self.log("%s", Highlight("MODULE 3: DATA SOURCE OBJECT EXTRACTION MODULE"))
 
         self._mqfm = mqfm
         self._qpm = qpm
@@ -41,10 +320,11 @@ class DSOEM(object):
         self._client = self.get_client()
         self._response = None
         self._query = self._qpm.query()
-        self._uris = []
+        # canonical URLs (see canonical_url) of the tag articles fetched and of the objects found by the queries
+        self._uris = set()
         self._hits = 0
         self._best_query = self._query
-        self._objects_added = []
+        self._objects_added = set()
         self._max_num_objects = 30
         self._client.num_results = self._max_num_objects
         self._data = None
@@ -57,20 +337,155 @@ class DSOEM(object):
 
         self._best_basiline_object = None
         self._num_objects = []
+        self._skipped_queries = 0
+        self._unsent_queries = 0
+        self._retrieval_stats = {}
         self._original_q = self._qpm.free_text()
         self._labeled_answer = self._qpm.labeled_answer()
 
-        self._data = self.encapsulate_objects(with_tags=False)
+        # objects of the multiqueries are streamed by iter_objects
+        self._stream = stream and self._multiqueries is not None
+        self._objects_stream = None
+        self._streamed_objects = []
+        if not self._stream:
+            self._data = self.encapsulate_objects(with_tags=DSOEM.TAG_EXPANSION)
 
         if self._qpm.question_type.value is QuestionType.SimpleFact.value and self._qpm.question_named_entities:
             self._kg_data = self.encapsulate_objects_from_kg()
 
-    def log(self, text):
-        print("[{}] {}".format(DSOEM.__qualname__, text))
+    def log(self, text, *args, level=logging.INFO):
+        logger.log(level, text, *args)
+
+    @staticmethod
+    def query_stats():
+        """
+        :return: query yield statistics shared by all DSOEM instances, loaded from QUERY_STATS_FILE
+        """
+        with DSOEM._query_stats_lock:
+            if DSOEM._query_stats is None:
+                DSOEM._query_stats = QueryYieldStats(DSOEM.QUERY_STATS_FILE)
+                if DSOEM.QUERY_STATS_FILE is not None:
+                    atexit.register(DSOEM._query_stats.save)
+            return DSOEM._query_stats
+
+    @staticmethod
+    def question_shape(qpm):
+        """
+        :param qpm: QPM object or QPMResult
+        :return: class of the question which query yield statistics are kept for: question type, first word and
+                 whether a numerical answer is expected
+        """
+        words = qpm.free_text().split()
+        return "{}:{}:{}".format(qpm.question_type.name,
+                                 words[0].lower() if words else "",
+                                 "numerical" if qpm.is_numerical_answer_expected() else "other")
+
+    @staticmethod
+    def canonical_url(url):
+        """
+        :param url: URL of a data source object
+        :return: key of the document of the URL, which is the URL without scheme, "www.", trailing slash, fragment and
+                 utm (campaign tracking) parameters, and with a lower-case host
+        """
+        if url is None:
+            return None
+        url = url.strip()
+        parts = urlsplit(url)
+        if not parts.netloc:
+            # no scheme, e.g. www.example.com/page
+            parts = urlsplit("//" + url)
+        host = parts.netloc.lower()
+        if host.startswith("www."):
+            host = host[4:]
+        key = host + parts.path.rstrip("/")
+        query = "&".join(param for param in parts.query.split("&")
+                         if param and not re.match(r'utm(_|=|$)', param.lower()))
+        if query:
+            key += "?" + query
+        return key
+
+    def skipped_queries(self):
+        """
+        :return: number of search queries of this question not sent because of QUERY_PRUNING
+        """
+        return self._skipped_queries
+
+    def retrieval_stats(self):
+        """
+        :return: search API calls and response bytes of this question, and the ones saved by adaptive paging and early
+                 termination compared to asking for the object limit with each query
+        """
+        return self._retrieval_stats
 
     def get_data_objects(self):
+        if self._data is None and self._stream:
+            for _ in self.iter_objects():
+                pass
         return self._data
 
+    def is_streaming(self):
+        """
+        :return: True if the objects are collected as iter_objects is consumed
+        """
+        return self._stream
+
+    def iter_objects(self):
+        """
+            streams the objects collected from the search queries as their responses are processed, so they can be
+            consumed while the responses of the next queries are still awaited. Once consumed, get_data_objects returns
+            them in rank order
+        :return: generator of the (object, query rank, query grams) collected. If the objects were collected already,
+                 they are yielded in rank order
+        """
+        if self._data is not None:
+            yield from self._data[1]
+            return
+
+        # a single collection is shared by the consumers: the objects it yielded already are yielded again first, so
+        # a consumer stopping early doesn't make the next one send the search queries again
+        if self._objects_stream is None:
+            self._objects_stream = self._produce_objects()
+        index = 0
+        while True:
+            if index == len(self._streamed_objects):
+                encapsulated_object = next(self._objects_stream, None)
+                if encapsulated_object is None:
+                    break
+                self._streamed_objects.append(encapsulated_object)
+            yield self._streamed_objects[index]
+            index += 1
+
+        if self._data is None:
+            self._data = (self._best_query, sorted(self._streamed_objects, key=lambda o: o[1]))
+
+    def _produce_objects(self):
+        """
+            collects the objects of the multiqueries on a background thread, so that the search queries are sent and
+            their responses processed while the consumer of the objects works on the ones collected before. The queue
+            between them holds at most the object limit, so the thread never blocks and ends even if the consumer stops
+        :return: generator of the objects collected, in the order of _iter_objects_mq. Errors of the collection are
+                 raised by it
+        """
+        collected = queue.Queue()
+        end = object()
+
+        def produce():
+            try:
+                for encapsulated_object in self._iter_objects_mq(DSOEM.TAG_EXPANSION):
+                    collected.put(encapsulated_object)
+            except Exception as e:
+                collected.put(e)
+            collected.put(end)
+
+        threading.Thread(target=produce, name="DSOEM-objects", daemon=True).start()
+        while True:
+            encapsulated_object = collected.get()
+            if encapsulated_object is end:
+                return
+            if isinstance(encapsulated_object, Exception):
+                raise encapsulated_object
+            yield encapsulated_object
+
     def get_kg_data_objects(self):
         return self._kg_data
 
@@ -117,15 +532,14 @@ class DSOEM(object):
         if ext == ".js":
             return False
 
-        text = object.text()
-        if text is not None and text != "":
-            num_new_lines = text.count("\n")
+        # the statistics are cached on the object for the later stages
+        stats = object.text_stats()
+        if stats.tokens > 0:
+            num_new_lines = stats.lines
             if num_new_lines == 0:
                 num_new_lines = 1
 
-            num_tokens = len(text.split())
-            average_token_len = len(text)/num_tokens
-            if average_token_len < 30 and num_tokens/num_new_lines > 3:
+            if stats.mean_token_length < 30 and stats.tokens/num_new_lines > 3:
                 return True
             else:
                 return False
@@ -165,29 +579,220 @@ class DSOEM(object):
         :param with_tags: 
         :return: 
         """
+        encapsulated_objects = list(self._iter_objects_mq(with_tags))
 
-        def not_duplicate(object):
-            for o in encapsulated_objects:
-                if object.url().replace('https://', '').replace('http://', '') ==\
-                   o[0].url().replace('https://', '').replace('http://', ''):
-                    return False
-
-            return True
+        # objects are ranked by query rank, whatever order the queries were sent in
+        encapsulated_objects.sort(key=lambda o: o[1])
+        return self._best_query, encapsulated_objects
 
+    def _iter_objects_mq(self, with_tags):
+        """
+            collects the objects of the multiqueries
+        :param with_tags: also collect the tag articles of the objects, see _expand_tags
+        :return: generator of the (object, query rank, query grams) collected, in the order the queries are processed
+        """
         encapsulated_objects = []
+        encapsulated_urls = set()
+        near_duplicates = None
+        if DSOEM.NEAR_DUPLICATE_SIMILARITY is not None:
+            near_duplicates = NearDuplicateFilter(DSOEM.NEAR_DUPLICATE_SIMILARITY, DSOEM.NEAR_DUPLICATE_SHINGLE_SIZE,
+                                                  DSOEM.NEAR_DUPLICATE_PARAGRAPH_SIZE)
         multiqueries = self._multiqueries
 
-        for index, query in enumerate(multiqueries):
-            if len(encapsulated_objects) >= self._max_num_objects:
-                break  # limit to self._max_num_objects
-            obj_data = self._encapsulate_objects_mq_helper(query[0], with_tags)
-
-            for object in obj_data:
+        stats = DSOEM.query_stats()
+        shape = DSOEM.question_shape(self._qpm)
+        order, low_yield = stats.plan([query[1] for query in multiqueries], shape, DSOEM.QUERY_PRUNING,
+                                      DSOEM.QUERY_MIN_CALLS, DSOEM.QUERY_MIN_YIELD, DSOEM.QUERY_EXPLORE_EVERY)
+        page_size = min(DSOEM.QUERY_PAGE_SIZE, self._max_num_objects) \
+            if DSOEM.QUERY_PAGE_SIZE and self._server == "dkg" else None
+        sent = []
+        outcomes = []
+        num_calls = 0
+        num_bytes = 0
+        num_documents_requested = 0
+        num_documents_received = 0
+
+        def first_page(index):
+            # as many documents as needed at the valid object yield of the queries processed so far
+            if page_size is None:
+                return None
+            missing = self._max_num_objects - len(encapsulated_objects)
+            if len(encapsulated_objects) > 0:
+                needed = math.ceil(missing * num_documents_received / len(encapsulated_objects))
+            else:
+                needed = page_size if num_documents_received == 0 else missing
+            return min(self._max_num_objects, max(page_size, needed))
+
+        # the queries are sent ahead of the one processed while objects are missing, up to MAX_CONCURRENT_QUERIES at a
+        # time, their responses are processed in the plan order. Deferred low-yield queries are only sent when needed
+        responses = self._search_queries([multiqueries[index][0] for index in order], first_page,
+                                         [index not in low_yield for index in order],
+                                         lambda: len(encapsulated_objects) < self._max_num_objects)
+        try:
+            for index in order:
+                query = multiqueries[index]
+                if len(encapsulated_objects) >= self._max_num_objects:
+                    break  # limit to self._max_num_objects, the queries not sent yet are cancelled
+                response, latency, requested = next(responses)
+                if requested is None:
+                    requested = self._max_num_objects
+                sent.append(index)
+
+                num_added = 0
+                num_new = 0
+                num_documents = 0
+                pages = 0
+                while True:
+                    pages += 1
+                    num_documents_requested += requested
+                    num_bytes += DSOEM._response_size(response)
+                    obj_data, page_documents = self._encapsulate_objects_mq_helper(query[0], response)
+                    num_documents += page_documents
+                    num_new += len(obj_data)
+
+                    for object, url in obj_data:
+                        if len(encapsulated_objects) < self._max_num_objects and self.is_valid_text(object) and\
+                                url not in encapsulated_urls and\
+                                (near_duplicates is None or near_duplicates.add(object)): # and self._contains_query_grams(object, query[0]):
+                            encapsulated_objects.append((object, query[2], query[0]))
+                            encapsulated_urls.add(url)
+                            num_added += 1
+                            yield encapsulated_objects[-1]
+
+                    missing = self._max_num_objects - len(encapsulated_objects)
+                    if page_size is None or missing <= 0 or page_documents < requested or \
+                            num_documents >= self._max_num_objects:
+                        break
+                    # next page, with as many documents as needed at the valid object yield of the query so far
+                    needed = math.ceil(missing * num_documents / num_added) if num_added > 0 else missing
+                    requested = min(self._max_num_objects - num_documents, max(page_size, needed))
+                    response, page_latency = self._search(query[0], num_documents, requested)
+                    latency += page_latency
+
+                if num_documents > 0:
+                    self._num_objects.append(num_new)
+                num_calls += pages
+                num_documents_received += num_documents
+                stats.record(query[1], shape, num_added, latency)
+                outcomes.append({'type': query[1], 'rank': query[2], 'objects': num_added, 'latency': latency,
+                                 'pages': pages, 'documents': num_documents})
+        finally:
+            # also when a consumer of the objects stops early or processing fails
+            responses.close()
+        # queries sent ahead but not needed
+        num_calls += len(order) - len(sent) - self._unsent_queries
+        self._record_retrieval(len(sent), num_calls, num_bytes, num_documents_requested, num_documents_received)
+
+        if with_tags and len(encapsulated_objects) < self._max_num_objects:
+            # tag articles rank with the object they tag
+            tagged_objects = [o[0] for o in encapsulated_objects]
+            for object, url, index in self._expand_tags(tagged_objects):
                 if len(encapsulated_objects) < self._max_num_objects and self.is_valid_text(object) and\
-                        not_duplicate(object): # and self._contains_query_grams(object, query[0]):
-                    encapsulated_objects.append((object, query[2], query[0]))
+                        url not in encapsulated_urls and (near_duplicates is None or near_duplicates.add(object)):
+                    tagged = encapsulated_objects[index]
+                    encapsulated_objects.append((object, tagged[1], tagged[2]))
+                    encapsulated_urls.add(url)
+                    yield encapsulated_objects[-1]
+
+        if near_duplicates is not None and near_duplicates.documents > 0:
+            DSOEM.near_duplicate_documents += near_duplicates.documents
+            DSOEM.near_duplicate_paragraphs += near_duplicates.paragraphs
+            self.log("Near-duplicate objects dropped: %s (%s paragraphs)", near_duplicates.documents,
+                     near_duplicates.paragraphs)
+
+        self._skipped_queries = len([index for index in low_yield if index not in sent])
+        DSOEM.skipped_query_calls += self._skipped_queries
+        if self._skipped_queries > 0:
+            self.log("Low-yield queries not sent: %s", self._skipped_queries)
+
+        stats.question_done(DSOEM.QUERY_STATS_SAVE_EVERY)
+        if DSOEM.QUERY_LOG_FILE is not None:
+            with open(DSOEM.QUERY_LOG_FILE, "a", encoding='utf-8') as f:
+                f.write(json.dumps({'shape': shape, 'max_objects': self._max_num_objects, 'queries': outcomes}) + "\n")
+
+    def _record_retrieval(self, num_queries, num_calls, num_bytes, num_documents_requested, num_documents_received):
+        """
+            records the search API calls and response bytes of the question, and the ones saved compared to asking for
+            the object limit with each of the num_queries queries processed, one by one
+        :return: None
+        """
+        baseline_documents = num_queries * self._max_num_objects
+        bytes_per_document = num_bytes / num_documents_received if num_documents_received > 0 else 0
+        self._retrieval_stats = {
+            'calls': num_calls,
+            'calls_saved': num_queries - num_calls,
+            'bytes': num_bytes,
+            'bytes_saved': int(max(0, baseline_documents - num_documents_requested) * bytes_per_document),
+        }
+        DSOEM.search_calls += num_calls
+        DSOEM.search_calls_saved += self._retrieval_stats['calls_saved']
+        DSOEM.response_bytes += num_bytes
+        DSOEM.response_bytes_saved += self._retrieval_stats['bytes_saved']
+        self.log("Search API calls: %s (%s saved), response bytes: %s (~%s saved)", num_calls,
+                 self._retrieval_stats['calls_saved'], num_bytes, self._retrieval_stats['bytes_saved'])
+
+    @staticmethod
+    def _response_size(response):
+        """
+        :return: size of a data source response in bytes, 0 if unknown
+        """
+        return response.size() if response is not None and hasattr(response, 'size') else 0
 
-        return self._best_query, encapsulated_objects
+    def _search(self, query, start_index=0, num_results=None):
+        """
+            sends a search query to the data source
+        :param query: search query
+        :param start_index: index of the first document requested (Diffbot)
+        :param num_results: number of documents requested (Diffbot), the client's num_results if None
+        :return: response and latency in seconds
+        """
+        start = time.perf_counter()
+        if self._server == "dkg":
+            response = self._client.simple_search(query, num_results=num_results, start_index=start_index)
+        else:
+            response = self._client.simple_search(query)
+        return response, time.perf_counter() - start
+
+    def _search_queries(self, queries, num_results=None, send_ahead=None, more_needed=None):
+        """
+            sends search queries to the data source, up to MAX_CONCURRENT_QUERIES at a time. A query is sent when its
+            response is needed, or ahead of that while the previous ones are processed if more responses are needed
+        :param queries: search queries, in the order their responses are needed
+        :param num_results: number of documents requested by each query (see _search), or function of the index of a
+                            query returning it when the query is sent
+        :param send_ahead: whether each query may be sent ahead, all of them if None
+        :param more_needed: function telling whether more responses are needed, checked before sending a query ahead
+        :return: generator of (response, latency in seconds, number of documents requested) of the queries, in order.
+                 Closing it cancels the queries not sent yet, their number is kept in self._unsent_queries
+        """
+        def requested(index):
+            return num_results(index) if callable(num_results) else num_results
+
+        self._unsent_queries = len(queries)
+        if DSOEM.MAX_CONCURRENT_QUERIES <= 1 or len(queries) <= 1:
+            for index, query in enumerate(queries):
+                self._unsent_queries -= 1
+                num = requested(index)
+                yield self._search(query, 0, num) + (num,)
+            return
+
+        executor = ThreadPoolExecutor(max_workers=min(DSOEM.MAX_CONCURRENT_QUERIES, len(queries)))
+        in_flight = deque()
+        submitted = 0
+        try:
+            while submitted < len(queries) or len(in_flight) > 0:
+                while submitted < len(queries) and (len(in_flight) == 0 or (
+                        len(in_flight) < DSOEM.MAX_CONCURRENT_QUERIES and
+                        (send_ahead is None or send_ahead[submitted]) and (more_needed is None or more_needed()))):
+                    num = requested(submitted)
+                    in_flight.append((executor.submit(self._search, queries[submitted], 0, num), num))
+                    submitted += 1
+                future, num = in_flight.popleft()
+                yield future.result() + (num,)
+        finally:
+            cancelled = len([future for future, num in in_flight if future.cancel()])
+            self._unsent_queries = len(queries) - submitted + cancelled
+            executor.shutdown(wait=False)
 
     def encapsulate_objects(self, with_tags=True):
         """
@@ -251,23 +856,8 @@ class DSOEM(object):
                 if hasattr(object, 'text') and non_empty_string(object.text()) and object.humanLanguage() == 'en':
                     num_objects += 1
                     objects_list.append(object)
-                    if include_tags:
-                        tags = object.tags_sorted_by_score()
-                        if len(tags) > 0:
-                            for tag in tags:
-                                logging.debug(tag.label())
-                                logging.debug(tag.score())
-                                for token in self.query().split():
-                                    uri = tag.uri()
-                                    if token in tag.uri() and uri not in self._uris:
-                                        response = self._client.article(uri)
-                                        if response is not None:
-                                            objs = response.objects()
-                                        if len(objs) > 0:
-                                            tag_obj = objs[0]
-                                            if hasattr(tag_obj, 'text'):
-                                                self._uris.append(uri)
-                                                objects_list.append(tag_obj)
+            if include_tags:
+                objects_list.extend(tag_object for tag_object, _, _ in self._expand_tags(objects_list))
             self._num_objects.append(num_objects)
         return objects_list
 
@@ -287,17 +877,17 @@ class DSOEM(object):
         self._num_objects.append(num_objects)
         return objects_list
 
-    def _encapsulate_objects_mq_helper(self, query, include_tags):
+    def _encapsulate_objects_mq_helper(self, query, main_response):
         """
         Encapsulates objects from a single query
         :param query: 
-        :param include_tags: 
-        :return: A list of encapsulated objects 
+        :param main_response: response of the data source to the query
+        :return: A list of encapsulated objects with their canonical URLs (the new objects), and the number of objects in
+                 the response
         """
         objects_list = []
-        main_response = self._client.simple_search(query)
         if main_response is None:
-            return []
+            return [], 0
         hits = main_response.hits()
         objects = main_response.objects()
         last_score = 0
@@ -308,30 +898,64 @@ class DSOEM(object):
                 self._best_query = query
                 self._hits = hits
             for object in objects:
-                if hasattr(object, 'text') and hasattr(object,
-                                                       'url') and object.url() not in self._objects_added and object.humanLanguage() == 'en':
-                    self._objects_added.append(object.url())
+                if not hasattr(object, 'text') or not hasattr(object, 'url') or object.humanLanguage() != 'en':
+                    continue
+                url = DSOEM.canonical_url(object.url())
+                if url not in self._objects_added:
+                    self._objects_added.add(url)
                     num_objects += 1
-                    objects_list.append(object)
-                    if include_tags:
-                        tags = object.tags_sorted_by_score()
-                        if len(tags) > 0:
-                            for tag in tags:
-                                logging.debug(tag.label())
-                                logging.debug(tag.score())
-                                for token in self.query().split():
-                                    uri = tag.uri()
-                                    if token in tag.uri() and uri not in self._uris:
-                                        response = self._client.article(uri)
-                                        if response is not None:
-                                            objs = response.objects()
-                                        if len(objs) > 0:
-                                            tag_obj = objs[0]
-                                            if hasattr(tag_obj, 'text'):
-                                                self._uris.append(uri)
-                                                objects_list.append(tag_obj)
-            self._num_objects.append(num_objects)
-        return objects_list
+                    objects_list.append((object, url))
+        return objects_list, len(objects)
+
+    def _expand_tags(self, objects):
+        """
+            tag expansion stage: fetches the articles of the tags of the objects whose URI contains a query term. Each
+            URI is fetched once, the ones of the highest scored tags first, within the TAG_EXPANSION_MAX_URIS and
+            TAG_EXPANSION_MAX_SECONDS budget
+        :param objects: tagged objects
+        :return: list of (tag article object, its canonical URL, index of the tagged object in objects), in tag score
+                 order
+        """
+        tokens = self.query().split()
+        candidates = {}
+        for index, object in enumerate(objects):
+            for tag in object.tags():
+                uri = tag.uri()
+                if uri is None or not any(token in uri for token in tokens):
+                    continue
+                uri_key = DSOEM.canonical_url(uri)
+                score = tag.score() or 0.0
+                if uri_key in self._uris or uri_key in self._objects_added:
+                    continue
+                if uri_key not in candidates or score > candidates[uri_key][0]:
+                    candidates[uri_key] = (score, uri, index)
+
+        ranked = sorted(candidates.items(), key=lambda candidate: candidate[1][0], reverse=True)
+        ranked = ranked[:DSOEM.TAG_EXPANSION_MAX_URIS]
+        if len(ranked) == 0:
+            return []
+
+        executor = ThreadPoolExecutor(max_workers=min(DSOEM.TAG_EXPANSION_MAX_CONCURRENT, len(ranked)))
+        futures = [executor.submit(self._client.article, uri) for _, (_, uri, _) in ranked]
+        done, not_done = wait(futures, timeout=DSOEM.TAG_EXPANSION_MAX_SECONDS)
+        for future in not_done:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+        DSOEM.tag_fetches += len(done)
+        DSOEM.tag_fetches_timed_out += len(not_done)
+        if len(not_done) > 0:
+            self.log("Tag articles not fetched within %ss: %s", DSOEM.TAG_EXPANSION_MAX_SECONDS, len(not_done))
+
+        tag_objects = []
+        for (uri_key, (_, _, index)), future in zip(ranked, futures):
+            if future not in done or future.exception() is not None or future.result() is None:
+                continue
+            objs = future.result().objects()
+            if len(objs) > 0 and hasattr(objs[0], 'text'):
+                self._uris.add(uri_key)
+                tag_objects.append((objs[0], DSOEM.canonical_url(objs[0].url()), index))
+        return tag_objects
 
     def confidence(self, object):
         """
@@ -13,12 +13,12 @@ from __future__ import division
 import datetime
 import enum
 import json
+import logging
 import statistics
 import string
 
 import numpy as np
 #from config import Config
-from nltk.corpus import stopwords
 from sklearn.feature_extraction.text import TfidfVectorizer
 from websocket import create_connection
 from colorama import init
@@ -26,9 +26,13 @@ init() # colorama needed for Windows
 from colorama import Fore, Back, Style
 
 from qa_utils import *
+from qa_stopwords import answer_stop_words
+from qa_logging import Highlight, get_logger
 #from metrics.measure import *
 #from utils.pos_tagger import *
 
+logger = get_logger("FAESM")
+
 
 class FAESM:
     """
@@ -58,7 +62,7 @@ class FAESM:
         Constructor
         :param dsoem - instance of DSOEM class
         """
-        self.log("{}MODULE 4: FACTOID ANSWER EXTRACTION SELECTION MODULE{}".format(Style.BRIGHT, Style.RESET_ALL))
+        self.log("%s", Highlight("MODULE 4: FACTOID ANSWER EXTRACTION SELECTION MODULE"))
 
         self._best_query = None
         self._top_objects = None
@@ -90,8 +94,8 @@ class FAESM:
         self._generate_all_answer_paragraphs()
         self._process_with_bert()
 
-    def log(self, text):
-        print("[{}] {}".format(FAESM.__qualname__, text))
+    def log(self, text, *args, level=logging.INFO):
+        logger.log(level, text, *args)
 
     def _process_with_bert(self):
         before = datetime.datetime.now()
@@ -103,6 +107,10 @@ class FAESM:
         #self.log("BERT inference time: {} ms".format(duration))
 
     def _generate_all_answer_paragraphs(self):
+        if self._oem.is_streaming():
+            self._generate_all_answer_paragraphs_streamed()
+            return
+
         data = self._oem.get_data_objects()
         kg_data = self._oem.get_kg_data_objects()
         if data:
@@ -112,24 +120,53 @@ class FAESM:
         self._prepare_significant_query_terms()
 
         if kg_data:
-            print("FAESM.[BERT Candidates List] Adding KG API Answer Paragraphs")
+            self.log("[BERT Candidates List] Adding KG API Answer Paragraphs")
             self._select_answer_paragraphs_from_kg(kg_data)
 
         if self._top_objects:
             self.log("[BERT Candidates List] Adding Search API Answer Paragraphs")
             self._select_answer_paragraphs_from_global_search()
 
-        self.log("BERT Candidates List: {}".format(len(self._bert_candidates)))
+        self.log("BERT Candidates List: %s", len(self._bert_candidates))
+
+    def _generate_all_answer_paragraphs_streamed(self):
+        """
+            same as _generate_all_answer_paragraphs, with the objects streamed by DSOEM: the candidate answer paragraphs
+            of each object are built as it is collected, while the responses of the next search queries are awaited.
+            They are scored once all objects are collected, since the significant query terms depend on all of them
+        """
+        kg_data = self._oem.get_kg_data_objects()
+
+        prepared_objects = [(obj, self._prepare_candidate_answer_paragraphs(self._extract_sentences([obj]),
+                                                                            FAESM._object_text_stats(obj)))
+                            for obj in self._oem.iter_objects()]
+
+        self._best_query, self._top_objects = self._oem.get_data_objects()
+        self._prepare_significant_query_terms()
+
+        if kg_data:
+            self.log("[BERT Candidates List] Adding KG API Answer Paragraphs")
+            self._select_answer_paragraphs_from_kg(kg_data)
+
+        if self._top_objects:
+            self.log("[BERT Candidates List] Adding Search API Answer Paragraphs")
+            for obj, prepared in prepared_objects:
+                self._candidate_answers += self._score_candidate_answer_paragraphs(prepared, obj[1],
+                                                                                   self._all_significant_queries_terms)
+            self._select_top_answer_paragraphs()
+
+        self.log("BERT Candidates List: %s", len(self._bert_candidates))
 
     def _prepare_significant_query_terms(self):
         self._all_significant_queries_terms = set()
+        stop_words = self._oem._qpm.stop_words()
         for index, obj in enumerate(self._top_objects):
             diff_bot_obj = obj[0]
             query_rank = obj[1]
             query_grams = obj[2]
             for gram in query_grams:
                 for t in gram.split():
-                    if t not in self._oem._qpm.stop_words():
+                    if t not in stop_words:
                         self._all_significant_queries_terms.add(t.lower())
 
     def _select_answer_paragraphs_from_kg(self, kg_data):
@@ -240,6 +277,7 @@ class FAESM:
         error_analysis.add_value("BERT ANSWERS sorted by probability:")
         all_answers = {}
         all_answer_tokens = {}
+        stop_words = answer_stop_words()
         for item in bert_predictions:
             answer = item['text']
             probability = item['probability']
@@ -254,13 +292,6 @@ class FAESM:
                 all_answers[answer] = probability
 
             word_tokens = nltk.word_tokenize(answer)
-            stop_words = set(stopwords.words('english'))
-            stop_words.update(
-                ('where', 'who', 'whose', 'what', 'why', 'how', 'and', 'i', 'a', 'and', 'so', 'arnt', 'this',
-                 'when', 'it', 'many', 'many', 'so', 'cant',
-                 'yes', 'no', 'these', 'is', 'are', 'do', "about", "for", "is", "\"",
-                 ',', '.', '(', ')', '`', '\"', '\'', '-',))
-
             tokens = [w for w in word_tokens if not w.lower() in stop_words]
 
             for t in tokens:
@@ -346,8 +377,9 @@ class FAESM:
         smallest_distance = -1
 
         prev_token = ""
+        stop_words = self._oem._qpm.stop_words()
         for index, token in enumerate(paragraph_tokens):
-            if token not in self._oem._qpm.stop_words():
+            if token not in stop_words:
                 if token in query_grams:
                     if first_token_found:
                         # previous spawn has completed since we found next matching gram
@@ -387,26 +419,33 @@ class FAESM:
         words = FAESM.WORD.findall(text)
         return words
 
-    def _candidate_answer_paragraph_score(self, candidate, query_rank, query_grams):
+    def _candidate_answer_paragraph_score(self, candidate, query_rank, query_grams, tfidf_vector=None,
+                                          candidate_tokens=None):
+        """
+        :param tfidf_vector: TF-IDF vector of the candidate, computed with the vectorizer if None
+        :param candidate_tokens: lower-case word tokens of the candidate, computed if None
+        """
         if self._oem._qpm.is_numerical_answer_expected() and not FAESM._number_detector.has_number(candidate):
             return 0  # no numbers found, the score is 0
 
         all_query_tokens = set(query_grams)
-        candidate_tokens = self.regex_word_tokenize(candidate.lower())
+        if candidate_tokens is None:
+            candidate_tokens = self.regex_word_tokenize(candidate.lower())
         # candidate_tokens = nltk.word_tokenize(candidate.lower())
         candidate_tokens_set = set(candidate_tokens)
 
         term_coverage_set = all_query_tokens & candidate_tokens_set
         term_coverage_score = len(term_coverage_set) / len(all_query_tokens)
 
-        tfidf_vectorizer_vectors = self.vectorizer().transform([candidate])
+        if tfidf_vector is None:
+            tfidf_vector = self.vectorizer().transform([candidate])
 
         tfidf_score = 0
         tfidf_token_matches = 0
         for t in all_query_tokens:
             if t in self._tfidf_reverse_lookup:
                 index = self._tfidf_reverse_lookup[t]
-                temp = tfidf_vectorizer_vectors.A[0][index]
+                temp = tfidf_vector.A[0][index]
                 if temp > 0:
                     tfidf_score += temp
                     tfidf_token_matches += 1
@@ -418,59 +457,106 @@ class FAESM:
 
         score = tfidf_score + term_coverage_score + term_distance_score
 
-        if False:
+        if logger.isEnabledFor(logging.DEBUG):
             answer_str = "with answer" if self.contains_answer(candidate, self._labeled_answer) else "no answer"
-            print("    term_coverage_score: {}".format(term_coverage_score))
-            print("    tfidf_score: {}".format(tfidf_score))
-            print("    term_distance_score: {}".format(term_distance_score))
-            print("    important_terms_score: {}".format(important_terms_score))
-            print("    total score: {} {}".format(score, answer_str))
+            self.log("    term_coverage_score: %s", term_coverage_score, level=logging.DEBUG)
+            self.log("    tfidf_score: %s", tfidf_score, level=logging.DEBUG)
+            self.log("    term_distance_score: %s", term_distance_score, level=logging.DEBUG)
+            self.log("    important_terms_score: %s", important_terms_score, level=logging.DEBUG)
+            self.log("    total score: %s %s", score, answer_str, level=logging.DEBUG)
 
         return score
 
-    def _generate_candidate_answer_paragraphs(self, sentences, query_rank, query_grams):
-        docs = []
-
-        def add_candidate(candidate):
-            if candidate != "":
-                candidate_score = self._candidate_answer_paragraph_score(candidate, query_rank, query_grams)
+    def _generate_candidate_answer_paragraphs(self, sentences, query_rank, query_grams, stats=None):
+        return self._score_candidate_answer_paragraphs(self._prepare_candidate_answer_paragraphs(sentences, stats),
+                                                       query_rank, query_grams)
 
-                if candidate_score > 0:
-                    candidates.append((candidate_score, candidate))
-                else:
-                    zero_score_candidates.append((candidate_score, candidate))
+    @staticmethod
+    def _object_text_stats(obj):
+        """
+        :param obj: encapsulated object (object, query rank, query grams)
+        :return: TextStats of the object's text cached by DSOEM, None if the object has none
+        """
+        if hasattr(obj[0], 'text_stats'):
+            return obj[0].text_stats()
+        return None
 
-                self._collect_candidate_stats(candidate_score, candidate)
+    def _prepare_candidate_answer_paragraphs(self, sentences, stats=None):
+        """
+            builds the candidate answer paragraphs of an object, with the parts of their scores which don't depend on
+            the query terms
+        :param sentences: sentences of the object
+        :param stats: TextStats of the text the sentences were extracted from, if known
+        :return: candidate paragraphs, their TF-IDF vectors, their lower-case word tokens and the TF-IDF features
+                 reverse lookup
+        """
+        docs = []
 
         def chunkstring(string, length):
             return (string[0 + i:length + i] for i in range(0, len(string), length))
 
         # Build candidate answer paragraphs using sliding window method
-        candidates = []
-        zero_score_candidates = []
-        self._index_of_max_cos_sim_score = 0
         candidate = ""
+        # number of tokens of the candidate, kept up to date instead of splitting the candidate for every chunk
+        candidate_tokens = 0
+
+        # the sentences, stripped and joined, have at most the tokens of the text. A text with fewer tokens than the
+        # paragraph size makes a single paragraph
+        if stats is not None and stats.tokens < FAESM.ANSWER_PARAGRAPH_MAX_SIZE:
+            candidate = "".join(sentences)
+            sentences = []
 
         for index, sentence in enumerate(sentences):
             sentences_chunked = chunkstring(sentence, FAESM.ANSWER_PARAGRAPH_MAX_SIZE)
             for chunked_sentence in sentences_chunked:
-                if candidate is not "" and len(candidate.split()) + len(
-                        chunked_sentence.split()) > FAESM.ANSWER_PARAGRAPH_MAX_SIZE:
+                chunk_tokens = len(chunked_sentence.split())
+                if candidate != "" and candidate_tokens + chunk_tokens > FAESM.ANSWER_PARAGRAPH_MAX_SIZE:
                     docs.append(candidate)
                     candidate = ""
+                    candidate_tokens = 0
 
-                # append next candidate
+                # append next candidate, its last token and the first one of the chunk merge if no space separates them
+                if candidate != "" and not candidate[-1].isspace() and not chunked_sentence[0].isspace():
+                    candidate_tokens -= 1
                 candidate = candidate + chunked_sentence
+                candidate_tokens += chunk_tokens
 
         # add last one
         docs.append(candidate)
-        self.vectorizer().fit_transform(docs)
+        # the TF-IDF vectors of the candidates are the rows of the fitted documents matrix
+        tfidf_vectors = self.vectorizer().fit_transform(docs)
         tfidf_features = np.array(self.vectorizer().get_feature_names())
-        self._tfidf_reverse_lookup = {
+        tfidf_reverse_lookup = {
             word: idx for idx, word in enumerate(tfidf_features)}
+        tokens = [self.regex_word_tokenize(d.lower()) for d in docs]
+
+        return docs, tfidf_vectors, tokens, tfidf_reverse_lookup
+
+    def _score_candidate_answer_paragraphs(self, prepared, query_rank, query_grams):
+        """
+        :param prepared: candidate answer paragraphs of an object, see _prepare_candidate_answer_paragraphs
+        :return: (score, paragraph) of the candidates with a positive score, or of the first candidate if none has
+        """
+        docs, tfidf_vectors, tokens, self._tfidf_reverse_lookup = prepared
+
+        def add_candidate(candidate, index):
+            if candidate != "":
+                candidate_score = self._candidate_answer_paragraph_score(candidate, query_rank, query_grams,
+                                                                         tfidf_vectors[index], tokens[index])
 
-        for d in docs:
-            add_candidate(d)
+                if candidate_score > 0:
+                    candidates.append((candidate_score, candidate))
+                else:
+                    zero_score_candidates.append((candidate_score, candidate))
+
+                self._collect_candidate_stats(candidate_score, candidate)
+
+        candidates = []
+        zero_score_candidates = []
+        self._index_of_max_cos_sim_score = 0
+
+        for index, d in enumerate(docs):
+            add_candidate(d, index)
 
         # if there was no candidate with positive cos similarity, let's give it one entry
         # from zero cos similarity list, to give BERT a chance to find an answer
@@ -487,7 +573,6 @@ class FAESM:
             self.collect_answer_paragraphs_precision_at(paragraph, index, candidate_score)
 
     def _select_answer_paragraphs_from_global_search(self):
-        candidates = []
         for index, obj in enumerate(self._top_objects):
             diff_bot_obj = obj[0]
             query_rank = obj[1]
@@ -495,9 +580,14 @@ class FAESM:
 
             obj_sentences = self._extract_sentences([obj])
             cur_candidates = self._generate_candidate_answer_paragraphs(obj_sentences, query_rank,
-                                                                        self._all_significant_queries_terms)
+                                                                        self._all_significant_queries_terms,
+                                                                        FAESM._object_text_stats(obj))
             self._candidate_answers += cur_candidates
 
+        self._select_top_answer_paragraphs()
+
+    def _select_top_answer_paragraphs(self):
+        candidates = []
         # sort by score
         self._candidate_answers = sorted(self._candidate_answers, reverse=True)
 
@@ -530,7 +620,7 @@ class FAESM:
                 self.log("bert-qa_srv connection not available")
                 return
 
-        self.log("Sending candidate to BERT: {}".format(context))
+        self.log("Sending candidate to BERT: %s", context, level=logging.DEBUG)
         self._ws.send(json_data)
         # print("Sent")
         # print("Receiving...")
@@ -701,7 +791,7 @@ class FAESM:
 
         max_answers = 3
         for answer in answers:
-            self.log("{}   {}{}".format(Style.BRIGHT, answer, Style.RESET_ALL))
+            self.log("   %s", Highlight(answer))
             max_answers -= 1
             if max_answers == 0:
                 break
@@ -7,14 +7,21 @@ Author: Eduard Kegulskiy
 
 """
 
+import hashlib
+import json
+import logging
+import string
+import threading
 from nltk.tokenize import TweetTokenizer
-from nltk.corpus import stopwords
 from qa_utils import *
-from pattern.en import conjugate, lemma, lexeme,PAST,SG
+from qa_stopwords import query_stop_words
+from qa_logging import Highlight, get_logger
 from colorama import init
 init() # colorama needed for Windows
 from colorama import Fore, Back, Style
 
+logger = get_logger("FMQFM")
+
 class FactoidQueryParser:
     """
         Factoid Query parser which transforms a single user query into multiple search queries aimed to retrieve an
@@ -33,17 +40,101 @@ class FactoidQueryParser:
     QUOTED_TEXT_QUERY = "Quoted Text"
     QUOTED_TEXT_QUERY_RANK = 3
     Q_COLOR = Fore.CYAN
-
-    def __init__(self):
-        """
-        Class constructor
-
+    # bump when the query formulation changes in a way the rule tables below don't show, so that memoized queries
+    # (see formulate_multiquery) are invalidated
+    RULES_VERSION = 1
+
+    # Question terms and the term which an answer to such question would rather contain (see
+    # _replace_factoid_question_words). Earlier rules take priority, phrases starting with a lower-case letter also
+    # match their capitalized form
+    ANSWER_FORM_RULES = [
+        ("when were", "date"),
+        ("when is", "date"),
+        ("when are", "date"),
+        ("how long is", "length"),
+        ("how long are", "length"),
+        ("how long was", "length"),
+        ("how long were", "length"),
+        ("how long does", "duration"),
+        ("how long", "estimation"),
+        ("how fast", "speed"),
+        ("how tall", "height"),
+    ]
+    # applied after 'how many' is rewritten
+    MEASURE_RULES = [
+        ("how much", "amount"),
+        ("How often does", "frequency"),
+        ("How often is", "frequency"),
+        ("How often was", "frequency"),
+        ("how high is", "height"),
+        ("how high are", "height"),
+        ("how high was", "height"),
+        ("how high were", "height"),
+        ("how big is", "size"),
+        ("how big are", "size"),
+        ("how big was", "size"),
+        ("how big were", "size"),
+    ]
+    # terms asking about the name, answers usually won't contain them (see _remove_name_tokens)
+    NAME_RULES = [
+        ("What was the name of", ""),
+        ("What is the name of", ""),
+    ]
+    # terms starting with the special pair "for whom" (see _remove_begin_pairs_tokens)
+    BEGIN_PAIRS_RULES = [
+        ("for whom was", ""),
+        ("for whom is", ""),
+        ("for whom are", ""),
+    ]
+
+    # POS tags of the terms written into the query by the rules above and _replace_factoid_question_words (see
+    # _project_pos_tags)
+    REWRITE_TAGS = dict([(replacement, 'NN') for _, replacement in ANSWER_FORM_RULES + MEASURE_RULES] +
+                        [('number', 'NN'), ('of', 'IN'), ('in', 'IN'), ('was', 'VBD'), ('has', 'VBZ'), ('have', 'VBP')])
+
+    _answer_form_rewriter = KGQAPhraseRewriter(ANSWER_FORM_RULES)
+    _measure_rewriter = KGQAPhraseRewriter(MEASURE_RULES)
+    _answer_form_and_measure_rewriter = KGQAPhraseRewriter(ANSWER_FORM_RULES + MEASURE_RULES)
+    _name_rewriter = KGQAPhraseRewriter(NAME_RULES)
+    _begin_pairs_rewriter = KGQAPhraseRewriter(BEGIN_PAIRS_RULES)
+    # dots which are replaced with DOT_TOKEN (see _process_dots), and quote characters (see _scan_quotes)
+    _dot_regex = re.compile(r'(?<! )\.')
+    _quote_regex = re.compile('[\'"`]')
+    # stateless, shared by all parsers
+    _tweet_tokenizer = TweetTokenizer()
+
+    @staticmethod
+    def rules_hash():
+        """
+        :return: hash of the rule tables, RULES_VERSION and the past tense table, which determine the queries
+                 formulated for a question
+        """
+        rules = [FactoidQueryParser.RULES_VERSION,
+                 FactoidQueryParser.ANSWER_FORM_RULES,
+                 FactoidQueryParser.MEASURE_RULES,
+                 FactoidQueryParser.NAME_RULES,
+                 FactoidQueryParser.BEGIN_PAIRS_RULES,
+                 sorted(FactoidQueryParser.REWRITE_TAGS.items()),
+                 FactoidQueryParser.QUOTED_TOKEN,
+                 FactoidQueryParser.DOT_TOKEN,
+                 FactoidQueryParser.MAX_GRAM_SIZE]
+        digest = hashlib.sha1(json.dumps(rules).encode("utf-8"))
+        with open(KGQAPastTense.TABLE_FILE, "rb") as f:
+            digest.update(f.read())
+        return digest.hexdigest()
+
+    def __init__(self, query="", qpm=None):
+        """
+        Class constructor. A parser holds the state of formulating one query, use one parser per call (see
+        formulate_multiquery) when formulating queries concurrently
+
+        :param query: user question
+        :param qpm: QPM module (or its QPMResult) of the question
         :returns instance of FactoidQueryParser
         """
-        self._user_query = ""
+        self._user_query = query
         self._parsed_query = ""
         self._search_queries = []
-        self._tweet_tokenizer = TweetTokenizer()
         self._quotes = []
         self._parsed_query_tokens = []
         self._pos_tags = []
@@ -51,24 +142,13 @@ class FactoidQueryParser:
         self._pos_query = ""
         self._quoted_query = ""
         self._1_grams_query = ""
-        self._qpm = None
+        self._qpm = qpm
         self._POSTagger = KGQAPOSTagger()
 
-        self._stop_words = set(stopwords.words('english'))
-        self._stop_words.update(('Where', 'Who', 'Whose', 'What', 'Why', 'How', 'and', 'I', 'A', 'And', 'So', 'arnt', 'This',
-                           'When', 'It', 'many', 'Many', 'so', 'cant', 'whom'
-                           'Yes', 'yes', 'No', 'no', 'These', 'these', 'is', 'are', 'Do', "Are", "About", "For", "Is", "\""))
-        self._stop_words.remove('own')
-        self._stop_words.remove('too')
-        self._stop_words.remove('won')
-        self._stop_words.remove('in')
-        self._stop_words.remove('of')
-        self._stop_words.remove('have')
-        self._stop_words.remove('has')
-        self._stop_words.remove('had')
-
-    def log(self, text):
-        print("[{}] {}".format(FMQFM.__qualname__, text))
+        self._stop_words = query_stop_words()
+
+    def log(self, text, *args, level=logging.INFO):
+        logger.log(level, text, *args)
 
     # Public methods
     @property
@@ -115,92 +195,42 @@ class FactoidQueryParser:
             self._parsed_query = self._parsed_query.replace("What year was", "")
             self._parsed_query += " in"
 
-        self._parsed_query = self._parsed_query.replace("when were", "date")
-        self._parsed_query = self._parsed_query.replace("When were", "date")
-
-        self._parsed_query = self._parsed_query.replace("when is", "date")
-        self._parsed_query = self._parsed_query.replace("When is", "date")
-
-        self._parsed_query = self._parsed_query.replace("when are", "date")
-        self._parsed_query = self._parsed_query.replace("When are", "date")
-
-        self._parsed_query = self._parsed_query.replace("how long is", "length")
-        self._parsed_query = self._parsed_query.replace("How long is", "length")
-
-        self._parsed_query = self._parsed_query.replace("how long are", "length")
-        self._parsed_query = self._parsed_query.replace("How long are", "length")
-
-        self._parsed_query = self._parsed_query.replace("how long was", "length")
-        self._parsed_query = self._parsed_query.replace("How long was", "length")
-
-        self._parsed_query = self._parsed_query.replace("how long were", "length")
-        self._parsed_query = self._parsed_query.replace("How long were", "length")
+        if not self._parsed_query.lower().startswith('how many'):
+            # nothing is rewritten between the two rule tables, so they are applied in a single scan
+            self._parsed_query = FactoidQueryParser._answer_form_and_measure_rewriter.rewrite(self._parsed_query)
+            return
 
-        self._parsed_query = self._parsed_query.replace("how long does", "duration")
-        self._parsed_query = self._parsed_query.replace("How long does", "duration")
+        self._parsed_query = FactoidQueryParser._answer_form_rewriter.rewrite(self._parsed_query)
 
-        self._parsed_query = self._parsed_query.replace("how long", "estimation")
-        self._parsed_query = self._parsed_query.replace("How long", "estimation")
-
-        self._parsed_query = self._parsed_query.replace("How fast", "speed")
-        self._parsed_query = self._parsed_query.replace("how fast", "speed")
-
-        self._parsed_query = self._parsed_query.replace("How tall", "height")
-        self._parsed_query = self._parsed_query.replace("how tall", "height")
+        simple_set = ['is', 'was', 'are', 'were', 'does', 'do', 'have']
+        simple_q = True
+        do = False
+        verbs = self._qpm.query_verbs()
+        for v in verbs:
+            if v.lower() in simple_set:
+                if v == 'do':
+                    do = True
+                continue
+            else:
+                simple_q = False
+                break
 
-        if self._parsed_query.lower().startswith('how many'):
-            simple_set = ['is', 'was', 'are', 'were', 'does', 'do', 'have']
-            simple_q = True
-            do = False
-            verbs = self._qpm.query_verbs()
-            for v in verbs:
-                if v.lower() in simple_set:
-                    if v == 'do':
-                        do = True
-                    continue
-                else:
-                    simple_q = False
-                    break
-
-            if simple_q:
-                self._parsed_query = self._parsed_query.replace("How many", "number of ")
-                self._parsed_query = self._parsed_query.replace("how many", "number of ")
-                for w in verbs:
-                    if w == 'have':
-                        if do is True:
-                            self._parsed_query = self._parsed_query.replace(w, 'have')
-                        else:
-                            self._parsed_query = self._parsed_query.replace(w, 'has')
+        if simple_q:
+            self._parsed_query = self._parsed_query.replace("How many", "number of ")
+            self._parsed_query = self._parsed_query.replace("how many", "number of ")
+            for w in verbs:
+                if w == 'have':
+                    if do is True:
+                        self._parsed_query = self._parsed_query.replace(w, 'have')
                     else:
-                        self._parsed_query = self._parsed_query.replace(w, '')
-            else:
-                self._parsed_query = self._parsed_query.replace("How many", "number")
-                self._parsed_query = self._parsed_query.replace("how many", "number")
-
-        self._parsed_query = self._parsed_query.replace("How much", "amount")
-        self._parsed_query = self._parsed_query.replace("how much", "amount")
-
-        self._parsed_query = self._parsed_query.replace("How often does", "frequency")
-        self._parsed_query = self._parsed_query.replace("How often is", "frequency")
-        self._parsed_query = self._parsed_query.replace("How often was", "frequency")
-
-        self._parsed_query = self._parsed_query.replace("how high is", "height")
-        self._parsed_query = self._parsed_query.replace("How high is", "height")
-        self._parsed_query = self._parsed_query.replace("how high are", "height")
-        self._parsed_query = self._parsed_query.replace("How high are", "height")
-        self._parsed_query = self._parsed_query.replace("how high was", "height")
-        self._parsed_query = self._parsed_query.replace("How high was", "height")
-        self._parsed_query = self._parsed_query.replace("how high were", "height")
-        self._parsed_query = self._parsed_query.replace("How high were", "height")
-
-        self._parsed_query = self._parsed_query.replace("how big is", "size")
-        self._parsed_query = self._parsed_query.replace("How big is", "size")
-        self._parsed_query = self._parsed_query.replace("how big are", "size")
-        self._parsed_query = self._parsed_query.replace("How big are", "size")
-        self._parsed_query = self._parsed_query.replace("how big was", "size")
-        self._parsed_query = self._parsed_query.replace("How big was", "size")
-        self._parsed_query = self._parsed_query.replace("how big were", "size")
-        self._parsed_query = self._parsed_query.replace("How big were", "size")
+                        self._parsed_query = self._parsed_query.replace(w, 'has')
+                else:
+                    self._parsed_query = self._parsed_query.replace(w, '')
+        else:
+            self._parsed_query = self._parsed_query.replace("How many", "number")
+            self._parsed_query = self._parsed_query.replace("how many", "number")
+
+        self._parsed_query = FactoidQueryParser._measure_rewriter.rewrite(self._parsed_query)
 
     def _process_comas(self):
         """
@@ -209,7 +239,7 @@ class FactoidQueryParser:
         """
         self._parsed_query = self._parsed_query.replace(",", " ")
 
-    def generate_search_queries(self):
+    def generate_search_queries(self, pos_tags=None):
         """
             generates multiple search queries, aimed to find most relevant answers. The queries are sorted by their ability
             to find the answers, i.e. rank as following:
@@ -217,16 +247,12 @@ class FactoidQueryParser:
             POS-based  The original question is broken into multiple pieces, each being a multi-gram query of variable size.
                         The algorithm for deciding on how to break is based on parts-of-speech (POS)
             1-Gram simple boolean query with 1-gram terms
+        :param pos_tags: optional POS tags of answer_form_tokens() precomputed in a batch, if they don't match the
+                         tokens of the query, the tokens are tagged again
         :return: list of all generated queries as tuple: (query, query_type, query_rank)
         """
-        self._cleanup_previous()
-        self._parsed_query = self._user_query
-
-        self._replace_factoid_question_words()
-        self._process_comas()
-        self._process_quoted_text()
-        self._process_dots()
-        self._tokenize()
+        self._prepare_query_tokens()
+        self._tokenize(pos_tags)
 
         # Build all queries
         self._full_query = self._build_full_query()
@@ -237,12 +263,79 @@ class FactoidQueryParser:
         self._search_queries = self._post_process_queries()
         return self._search_queries
 
-    def _build_pos_tags(self):
+    def answer_form_tokens(self):
+        """
+            Transforms the query into likely answer form without tagging it, so that the tokens of many queries can be
+            POS tagged in a single batch (see FMQFM.batch_pos_tags)
+        :return: list of query tokens which generate_search_queries() will POS tag
+        """
+        self._prepare_query_tokens()
+        return list(self._parsed_query_tokens)
+
+    def _prepare_query_tokens(self):
+        self._cleanup_previous()
+        self._parsed_query = self._user_query
+
+        self._replace_factoid_question_words()
+        self._process_comas()
+        self._process_quoted_text()
+        self._process_dots()
+        self._transform_query()
+
+    def _build_pos_tags(self, pos_tags=None):
         """
-            Build parts-of-speech and NER tags
+            Build parts-of-speech tags of the query tokens. The tags of the question (tagged by QPM) are projected onto
+            the tokens, and only the tokens which can't be projected are sent to the tagger
+        :param pos_tags: optional precomputed POS tags, only used if they match the query tokens
         :return: None
         """
-        self._pos_tags, ner_tags = self._POSTagger.tag(self._parsed_query_tokens, ner=False)
+        if pos_tags is not None and [t[0] for t in pos_tags] == self._parsed_query_tokens:
+            self._pos_tags = list(pos_tags)
+            return
+
+        self._pos_tags = self._project_pos_tags()
+        unmapped = [index for index, tag in enumerate(self._pos_tags) if tag[1] is None]
+        FMQFM.count_pos_tags(fallback=len(unmapped) > 0)
+        if not unmapped:
+            return
+
+        tagged, ner_tags = self._POSTagger.tag([self._pos_tags[index][0] for index in unmapped], ner=False)
+        if len(tagged) == len(unmapped):
+            for index, tag in zip(unmapped, tagged):
+                self._pos_tags[index] = (self._pos_tags[index][0], tag[1])
+        else:
+            # the tagger split the tokens differently, tag the whole query
+            self._pos_tags, ner_tags = self._POSTagger.tag(self._parsed_query_tokens, ner=False)
+
+    def _project_pos_tags(self):
+        """
+            Projects the POS tags of the question onto the query tokens. Terms written by the rewrite rules get their
+            tag from REWRITE_TAGS, quoted text is a proper noun, and verbs which _process_does_verb suffixed with 's'
+            are VBZ
+        :return: list of (token, tag) of the query tokens, tag is None for tokens that couldn't be projected
+        """
+        question_tags = {}
+        for word, tag in self._qpm.pos_tags() or []:
+            question_tags.setdefault(word, tag)
+            question_tags.setdefault(word.strip(string.punctuation), tag)
+
+        verbs = self._qpm.query_verbs()
+        projected = []
+        for token in self._parsed_query_tokens:
+            word = token.replace(self.DOT_TOKEN, ".")
+            if token == FactoidQueryParser.QUOTED_TOKEN:
+                tag = 'NNP'
+            elif token in FactoidQueryParser.REWRITE_TAGS:
+                tag = FactoidQueryParser.REWRITE_TAGS[token]
+            elif word in question_tags:
+                tag = question_tags[word]
+            elif word.endswith("s") and word[:-1] in verbs:
+                tag = 'VBZ'
+            else:
+                tag = None
+            projected.append((token, tag))
+
+        return projected
 
     def _post_process_queries(self):
         """
@@ -328,25 +421,10 @@ class FactoidQueryParser:
         """
             Finds all dots in the user query and replaces them with special token.
             This is done for better tokenization handling since standard tokenizers do not handle dots well. This is
-            especially useful for acronyms (e.g. U.S.A. or U.N.)
+            especially useful for acronyms (e.g. U.S.A. or U.N.). Dots preceded by a space are kept
         :return: None
         """
-        prev_char = ""
-        dot_indexes = []
-
-        for index, char in enumerate(self._parsed_query):
-            if char == '.' and prev_char != " ":
-                dot_indexes.append(index)
-
-            prev_char = char
-
-        dot_token_size_adjustment = 0
-        for h in dot_indexes:
-            dot_pos = h + dot_token_size_adjustment
-            first_part = self._parsed_query[:dot_pos]
-            second_part = self._parsed_query[dot_pos+1:]
-            self._parsed_query = first_part + self.DOT_TOKEN + second_part
-            dot_token_size_adjustment += len(self.DOT_TOKEN) - 1
+        self._parsed_query = FactoidQueryParser._dot_regex.sub(self.DOT_TOKEN, self._parsed_query)
 
     def _cleanup_previous(self):
         self._search_queries = []
@@ -498,53 +576,57 @@ class FactoidQueryParser:
 
         return pos_tokens
 
+    @staticmethod
+    def _scan_quotes(text):
+        """
+            Finds quoted text in a single pass over the quote characters of the text. A quote starts at a quote character
+            preceded by a space, a dot or the beginning of the text, and ends at the next quote character followed by a
+            space or the end of the text
+        :param text: text to scan
+        :return: list of (start, end) indexes of the opening and closing quote characters of every quoted text, and the
+                 index of the opening quote character of an unterminated quote (None if all quotes are terminated)
+        """
+        spans = []
+        start = None
+        for match in FactoidQueryParser._quote_regex.finditer(text):
+            index = match.start()
+            if start is not None:
+                if index == len(text) - 1 or text[index + 1] == ' ':
+                    spans.append((start, index))
+                    start = None
+            elif index == 0 or text[index - 1] in ' .':
+                start = index
+
+        return spans, start
+
     def _process_quoted_text(self):
         """
             Finds all double and single - quotes in the user query and replaces them with special token.
             This is done for better tokenization handling since standard tokenizers do not handle quoted text well.
         :return: None
         """
+        text = self._parsed_query
+        spans, unterminated = FactoidQueryParser._scan_quotes(text)
 
-        if True:
-            self._quotes = []
-            processed_query = ''
-            potential_quote = ''
-            potential_quote_started = False
-            prev_c = ''
-            SPACE = ' '
-            QUOTE_CHARS = ['\'', '\"', '`']
-            for index, c in enumerate(self._parsed_query):
-                next_char = ''
-                if index < len(self._parsed_query)-1:
-                    next_char = self._parsed_query[index+1]
-
-                if c in QUOTE_CHARS:
-                    if potential_quote_started:
-                        if next_char == SPACE or next_char == '':
-                            # complete it
-                            potential_quote_started = False
-                            self._quotes.append(potential_quote)
-                            potential_quote = ''
-                            processed_query += FactoidQueryParser.QUOTED_TOKEN
-                        else:
-                            potential_quote += c
-                    elif prev_c == SPACE or prev_c == '' or prev_c == '.':
-                        potential_quote_started = True
-                    else:
-                        processed_query += c
-                elif potential_quote_started:
-                    potential_quote += c
-                else:
-                    processed_query += c
-
-                prev_c = c
-            # left over
-            if potential_quote != '':
-                processed_query += potential_quote
-
-            if processed_query != '':
-                self._parsed_query = processed_query
+        self._quotes = []
+        parts = []
+        position = 0
+        for start, end in spans:
+            parts.append(text[position:start])
+            parts.append(FactoidQueryParser.QUOTED_TOKEN)
+            self._quotes.append(text[start + 1:end])
+            position = end + 1
+
+        if unterminated is not None:
+            # the text of an unterminated quote is kept, without its opening quote character
+            parts.append(text[position:unterminated])
+            parts.append(text[unterminated + 1:])
+        else:
+            parts.append(text[position:])
 
+        processed_query = "".join(parts)
+        if processed_query != '':
+            self._parsed_query = processed_query
 
     def _remove_name_tokens(self):
         """
@@ -552,12 +634,7 @@ class FactoidQueryParser:
             won't usually contain any of these terms.
         :return: None
         """
-        self._parsed_query = self._parsed_query.replace("What was the name of", '')
-        self._parsed_query = self._parsed_query.replace("What was the name of the", '')
-        self._parsed_query = self._parsed_query.replace("What was the name of a", '')
-        self._parsed_query = self._parsed_query.replace("What is the name of", '')
-        self._parsed_query = self._parsed_query.replace("What is the name of the", '')
-        self._parsed_query = self._parsed_query.replace("What is the name of a", '')
+        self._parsed_query = FactoidQueryParser._name_rewriter.rewrite(self._parsed_query)
 
     def _remove_begin_pairs_tokens(self):
         """
@@ -567,12 +644,7 @@ class FactoidQueryParser:
         """
         if self._parsed_query.startswith('For whom') or \
                 self._parsed_query.startswith('for whom'):
-            self._parsed_query = self._parsed_query.replace("For whom was", '')
-            self._parsed_query = self._parsed_query.replace("for whom was", '')
-            self._parsed_query = self._parsed_query.replace("For whom is", '')
-            self._parsed_query = self._parsed_query.replace("for whom is", '')
-            self._parsed_query = self._parsed_query.replace("For whom are", '')
-            self._parsed_query = self._parsed_query.replace("for whom are", '')
+            self._parsed_query = FactoidQueryParser._begin_pairs_rewriter.rewrite(self._parsed_query)
 
     def _remove_stop_words(self):
         """
@@ -584,10 +656,10 @@ class FactoidQueryParser:
             self._parsed_query_tokens.pop(0)
 
 
-    def _tokenize(self):
+    def _transform_query(self):
         """
-            transform the query into search query for finding expected answer and tokenize it
-        :return:
+            transform the query into search query for finding expected answer and split it into tokens
+        :return: None
         """
         self._remove_name_tokens()
         self._remove_begin_pairs_tokens()
@@ -595,18 +667,19 @@ class FactoidQueryParser:
         self._remove_stop_words()
         self._process_does_verb()
 
-        self.log("Transforming question terms into likely answer form: {}{}{}{}".format(self.Q_COLOR,
-                                                                                        Style.BRIGHT,
-                                                                                        " ".join(self._parsed_query_tokens),
-                                                                                        Style.RESET_ALL))
+    def _tokenize(self, pos_tags=None):
+        """
+            tag the transformed query tokens and adjust them to the tense of the question
+        :param pos_tags: optional precomputed POS tags of the query tokens
+        :return:
+        """
+        self.log("Transforming question terms into likely answer form: %s",
+                 Highlight(" ".join(self._parsed_query_tokens), self.Q_COLOR))
 
-        self._build_pos_tags()
+        self._build_pos_tags(pos_tags)
         self._process_past_tense()
 
-        self.log("Tokenizing the query: {}{}{}{}".format(self.Q_COLOR,
-                                                         Style.BRIGHT,
-                                                         self._parsed_query_tokens,
-                                                         Style.RESET_ALL))
+        self.log("Tokenizing the query: %s", Highlight(self._parsed_query_tokens, self.Q_COLOR))
 
     def _process_does_verb(self):
         """
@@ -641,7 +714,7 @@ class FactoidQueryParser:
                 return 'bitten'
             elif v == 'found':
                 return 'founded'
-            return conjugate(verb=v, tense=PAST, number=SG) # he / she / it
+            return KGQAPastTense.past(v) # he / she / it
 
         is_past_tense = False
         past_tense_determiner_index = 0
@@ -684,39 +757,130 @@ class FactoidQueryParser:
             self._parsed_query_tokens.append(token.strip())
 
 
+def formulate_multiquery(qpm, pos_tags=None):
+    """
+        Generates the ranked search queries of a question. Only per-call state is used, so questions can be formulated
+        concurrently (e.g. from a thread pool)
+    :param qpm: QPM module (or its QPMResult) of the question
+    :param pos_tags: optional POS tags of the question's answer-form tokens precomputed with FMQFM.batch_pos_tags
+    :return: list of all generated queries as tuple: (query, query_type, query_rank)
+    """
+    def copy(multiquery):
+        return [(list(q[0]), q[1], q[2]) for q in multiquery]
+
+    def freeze(tags):
+        return None if tags is None else tuple(tuple(tag) for tag in tags)
+
+    # the queries depend on the question text as given and on the POS tags, QPM's ones projected on the tokens or the
+    # precomputed ones, so all of them are part of the key
+    key = (KGQAPOSTagger.BACKEND, qpm.free_text(), tuple(qpm.query_verbs()), freeze(qpm.pos_tags()), freeze(pos_tags))
+    cache = FMQFM.multiquery_cache()
+    multiquery = cache.get(key)
+    if multiquery is not None:
+        return copy(multiquery)
+
+    multiquery = FactoidQueryParser(qpm.free_text(), qpm).generate_search_queries(pos_tags)
+    cache.put(key, copy(multiquery))
+    return multiquery
+
+
 class FMQFM(object):
     """
         FMQFM module generates search queries that are optimized to retrieve the best objects with Diffbot Search API
     """
-    fquery_parser = FactoidQueryParser()
+    # number of queries whose POS tags were all projected from QPM's tags, and of those which needed the tagger for
+    # some tokens (see FactoidQueryParser._build_pos_tags)
+    pos_tags_projected = 0
+    pos_tags_fallbacks = 0
+    _pos_tags_lock = threading.Lock()
+
+    #####################################################################################################
+    # CONFIGURABLE PARAMETERS
+    # maximum number of formulated questions kept in memory
+    MULTIQUERY_CACHE_SIZE = 10000
+    # optional sqlite file which persists formulated questions between runs
+    MULTIQUERY_CACHE_FILE = None
+    #####################################################################################################
+
+    _multiquery_cache = None
+    _multiquery_cache_lock = threading.Lock()
 
-    def __init__(self, qpm):
+    def __init__(self, qpm, pos_tags=None):
         """
         Class constructor.
-        :param qpm QPM Module of FQAKG pipeline containing user question for which an answer needs to be retrieved
+        :param qpm QPM Module (or its QPMResult) of FQAKG pipeline containing user question for which an answer needs to be retrieved
+        :param pos_tags optional POS tags of the question's answer-form tokens precomputed with FMQFM.batch_pos_tags
         """
 
-        print("")
-        self.log("{}MODULE 2: FACTOID MULTI-QUERY FORMULATION MODULE{}".format(Style.BRIGHT, Style.RESET_ALL))
+        self.log("%s", Highlight("MODULE 2: FACTOID MULTI-QUERY FORMULATION MODULE"))
 
         self._original_q = qpm.free_text()
         self._multiquery_list = []
         self._qpm = qpm
         self.Q_COLOR = Fore.CYAN
 
-        FMQFM.fquery_parser.query = self.original_question()
-        FMQFM.fquery_parser.qpm = self._qpm
-        self._multiquery_list = FMQFM.fquery_parser.generate_search_queries()
+        self._multiquery_list = formulate_multiquery(self._qpm, pos_tags)
 
         self.log("Building ranked search queries:")
         for q in self._multiquery_list:
-            self.log("  [{}, rank={}]: {}{}{}{}".format(q[1], q[2], self.Q_COLOR,
-                                                                    Style.BRIGHT,
-                                                                    q[0],
-                                                                    Style.RESET_ALL))
+            self.log("  [%s, rank=%s]: %s", q[1], q[2], Highlight(q[0], self.Q_COLOR))
+
+    def log(self, text, *args, level=logging.INFO):
+        logger.log(level, text, *args)
+
+    @staticmethod
+    def batch_pos_tags(qpms):
+        """
+            POS tags the answer-form tokens of many questions in a single tagger invocation
+        :param qpms: list of QPM modules (or QPMResult objects)
+        :return: list of POS tags aligned with qpms, each to be passed to the FMQFM constructor
+        """
+        token_lists = [FactoidQueryParser(qpm.free_text(), qpm).answer_form_tokens() for qpm in qpms]
+
+        return [tags[0] for tags in KGQAPOSTagger().tag_batch(token_lists, ner=False)]
+
+    @staticmethod
+    def multiquery_cache():
+        """
+        :return: memo of formulated queries keyed by tagger backend, question, question verbs and POS tags. Persisted
+                 entries formulated with other rules (see FactoidQueryParser.rules_hash) are dropped
+        """
+        with FMQFM._multiquery_cache_lock:
+            if FMQFM._multiquery_cache is None:
+                FMQFM._multiquery_cache = KGQALRUCache(FMQFM.MULTIQUERY_CACHE_SIZE, FMQFM.MULTIQUERY_CACHE_FILE,
+                                                       "multiqueries", FactoidQueryParser.rules_hash())
+            return FMQFM._multiquery_cache
+
+    @staticmethod
+    def multiquery_cache_stats():
+        """
+        :return: hit/miss counters of the multiquery memo
+        """
+        return FMQFM.multiquery_cache().stats()
+
+    @staticmethod
+    def count_pos_tags(fallback):
+        """
+            counts a query whose POS tags were projected from QPM, with or without the tagger fallback
+        :param fallback: True if some tokens had to be tagged by the tagger
+        :return: None
+        """
+        with FMQFM._pos_tags_lock:
+            if fallback:
+                FMQFM.pos_tags_fallbacks += 1
+            else:
+                FMQFM.pos_tags_projected += 1
 
-    def log(self, text):
-        print("[{}] {}".format(FMQFM.__qualname__, text))
+    @staticmethod
+    def pos_tags_stats():
+        """
+        :return: counters of the POS tags projection
+        """
+        with FMQFM._pos_tags_lock:
+            total = FMQFM.pos_tags_projected + FMQFM.pos_tags_fallbacks
+            return {'projected': FMQFM.pos_tags_projected,
+                    'fallbacks': FMQFM.pos_tags_fallbacks,
+                    'fallback_rate': FMQFM.pos_tags_fallbacks / total if total else 0.0}
 
     def original_question(self):
         return self._original_q
@@ -8,14 +8,21 @@ Author: Eduard Kegulskiy
 
 """
 
-from nltk.corpus import stopwords
 from nltk.tokenize import TweetTokenizer
 import enum
+import itertools
+import json
+import logging
+import sys
 from qa_utils import *
+from qa_stopwords import question_stop_words
+from qa_logging import Highlight, HighlightTags, get_logger
 from colorama import init
 init() # colorama needed for Windows
 from colorama import Fore, Back, Style
 
+logger = get_logger("QPM")
+
 class QuestionType(enum.Enum):
     Unclassified = 1
     SimpleFact = 2
@@ -35,7 +42,13 @@ class QPM(object):
 
     # Constants
     Q_COLOR = Fore.CYAN
-    def __init__(self, question, labeled_answer=""):
+    # questions starting with these terms expect a numerical answer
+    NUMERICAL_ANSWER_PREFIXES = ('when', 'how hot', 'how big', 'how many', 'how much', 'how often', 'what date',
+                                 'how old', 'how close', 'how tall', 'how far', 'what year', 'how high',
+                                 'which number', 'how fast')
+    # number of questions tagged per tagger invocation by QPM.stream_results
+    BATCH_CHUNK_SIZE = 256
+    def __init__(self, question, labeled_answer="", tags=None):
         """
         Class constructor.
 
@@ -43,24 +56,26 @@ class QPM(object):
                 question - user question
                 labeled_answer[optional] - if provided, the class makes it available to other modules of the pipeline
                                            for collecting statistics and error analysis
+                tags[optional] - (POS tags, NER tags) of the question precomputed with QPM.batch_tags(), if not provided
+                                 the question is tagged by this instance
 
             # Returns
                 A QPM instance.
         """
-        self.log("{}MODULE 1: QUESTION PRE-PROCESSING MODULE{}".format(Style.BRIGHT, Style.RESET_ALL))
+        self.log("%s", Highlight("MODULE 1: QUESTION PRE-PROCESSING MODULE"))
 
-        self.log("Question: {}{}{}{}".format(QPM.Q_COLOR, Style.BRIGHT, question, Style.RESET_ALL))
-        self._stop_words = None
+        self.log("Question: %s", Highlight(question, QPM.Q_COLOR))
+        self._stop_words = question_stop_words()
         self._tknzr = TweetTokenizer()
         self._free_text = self.first_q(question)
 
         self._labeled_answer = labeled_answer
         self._question_type = QuestionType.Unclassified
         self._pos_tagger = KGQAPOSTagger()
-        self._collect_tags()
+        self._collect_tags(tags)
 
         self._query = self.get_sanitazed_sentence(self._free_text)
-        self.log("Stop-words removed: {}{}{}{}".format(QPM.Q_COLOR, Style.BRIGHT, self._query, Style.RESET_ALL))
+        self.log("Stop-words removed: %s", Highlight(self._query, QPM.Q_COLOR))
 
         self._entities = []
         self._important_query_terms = []
@@ -71,18 +86,72 @@ class QPM(object):
         self._classify_question()
         self._check_numerical_answer_expected()
 
-    def log(self, text):
-        print("[{}] {}".format(QPM.__qualname__, text))
+    def log(self, text, *args, level=logging.INFO):
+        logger.log(level, text, *args)
+
+    @staticmethod
+    def batch_tags(questions):
+        """
+            Tags many questions in a single tagger invocation
+        :param questions: list of user questions
+        :return: list of (POS tags, NER tags) aligned with questions, each to be passed to the QPM constructor
+        """
+        return KGQAPOSTagger().tag_batch([QPM.first_q(q) for q in questions])
+
+    @staticmethod
+    def read_questions(source):
+        """
+            Reads questions one line at a time. Each line is either a JSON object with a "question" and an optional
+            "answer" (or "labeled_answer"), a question and its labeled answer separated by a tab, or a plain question
+        :param source: path of the questions file, or "-" for stdin
+        :return: generator of (question, labeled answer) pairs
+        """
+        f = sys.stdin if source == "-" else open(source, encoding='utf-8')
+        try:
+            for line in f:
+                line = line.strip()
+                if line == "":
+                    continue
+                if line.startswith("{"):
+                    item = json.loads(line)
+                    yield item['question'], item.get('answer', item.get('labeled_answer', ""))
+                elif "\t" in line:
+                    question, labeled_answer = line.split("\t", 1)
+                    yield question, labeled_answer
+                else:
+                    yield line, ""
+        finally:
+            if f is not sys.stdin:
+                f.close()
 
-    def _collect_tags(self):
+    @staticmethod
+    def stream_results(questions, chunk_size=None):
+        """
+            Pre-processes a stream of questions, tagging BATCH_CHUNK_SIZE questions per tagger invocation. Only one
+            chunk is held in memory at a time
+        :param questions: iterable of (question, labeled answer) pairs, e.g. from QPM.read_questions
+        :param chunk_size: optional number of questions per chunk
+        :return: generator of QPMResult, in the order of the questions
+        """
+        questions = iter(questions)
+        chunk_size = chunk_size or QPM.BATCH_CHUNK_SIZE
+        while True:
+            chunk = list(itertools.islice(questions, chunk_size))
+            if not chunk:
+                return
+            tags = QPM.batch_tags([question for question, _ in chunk])
+            for (question, labeled_answer), question_tags in zip(chunk, tags):
+                yield QPM(question, labeled_answer, question_tags).result()
+
+    def _collect_tags(self, tags=None):
         # get parts-of-speech and NER tags
-        self._pos_tags, self._ner_tags = self._pos_tagger.tag(self._free_text)
+        if tags is None:
+            self._pos_tags, self._ner_tags = self._pos_tagger.tag(self._free_text)
+        else:
+            self._pos_tags, self._ner_tags = tags
 
         if self._pos_tags:
-            pos_str = ""
-            for t in self._pos_tags:
-                pos_str = pos_str + "{}{}{}{}({}) ".format(QPM.Q_COLOR, Style.BRIGHT, t[0], Style.RESET_ALL, t[1])
-            self.log("Parts of speech: {}".format(pos_str))
+            self.log("Parts of speech: %s", HighlightTags(self._pos_tags, QPM.Q_COLOR))
 
     def pos_tags(self):
         return self._pos_tags
@@ -170,10 +239,7 @@ class QPM(object):
             self._entities.append((cur_ner, cur_ner_type))
 
         if self._entities:
-            ner_str = ""
-            for t in self._entities:
-                ner_str = ner_str + "{}{}{}{}({}) ".format(QPM.Q_COLOR, Style.BRIGHT, t[0], Style.RESET_ALL, t[1])
-            self.log("Named entities: {}".format(ner_str))
+            self.log("Named entities: %s", HighlightTags(self._entities, QPM.Q_COLOR))
 
         if num_verbs <= 1 and len(self._pos_tags) <= 6:
             self._question_type = QuestionType.SimpleFact
@@ -190,7 +256,8 @@ class QPM(object):
     def question_named_entities(self):
         return self._entities
 
-    def first_q(self, text):
+    @staticmethod
+    def first_q(text):
         """
         :param text: the original text
         :return: the text without the ? character if any
@@ -214,7 +281,7 @@ class QPM(object):
         :return: sentence without stop words
         """
         word_tokens = self._tknzr.tokenize(text)
-        filtered_sentence = [w for w in word_tokens if not w in self.stop_words()]
+        filtered_sentence = [w for w in word_tokens if not w in self._stop_words]
         sentence = " ".join(filtered_sentence)
         return sentence
 
@@ -231,14 +298,6 @@ class QPM(object):
         return self._labeled_answer
 
     def stop_words(self):
-        if self._stop_words is None:
-            self._stop_words = set(stopwords.words('english'))
-            self._stop_words.update(('Where', 'Who', 'Whose', 'What', 'Why', 'How', 'and', 'I', 'A', 'And', 'So', 'arnt', 'This',
-                               'When', 'It', 'many', 'Many', 'so', 'cant',
-                               'Yes', 'yes', 'No', 'no', 'These', 'these', 'is', 'are', 'Do', "Are", "About", "For", "Is", "\""))
-            self._stop_words.remove('own')
-            self._stop_words.remove('too')
-
         return self._stop_words
 
     def _check_numerical_answer_expected(self):
@@ -246,21 +305,7 @@ class QPM(object):
         detects if provided question is expecting a numerical answer
         :return: none
         """
-        self._is_numerical_answer_expected = self._free_text.lower().startswith('when') |\
-                                             self._free_text.lower().startswith('how hot') | \
-                                             self._free_text.lower().startswith('how big') | \
-                                             self._free_text.lower().startswith('how many') | \
-                                             self._free_text.lower().startswith('how much') | \
-                                             self._free_text.lower().startswith('how often') | \
-                                             self._free_text.lower().startswith('what date') | \
-                                             self._free_text.lower().startswith('how old') | \
-                                             self._free_text.lower().startswith('how close') | \
-                                             self._free_text.lower().startswith('how tall') | \
-                                             self._free_text.lower().startswith('how far') | \
-                                             self._free_text.lower().startswith('what year') | \
-                                             self._free_text.lower().startswith('how high') | \
-                                             self._free_text.lower().startswith('which number') | \
-                                             self._free_text.lower().startswith('how fast')
+        self._is_numerical_answer_expected = self._free_text.lower().startswith(QPM.NUMERICAL_ANSWER_PREFIXES)
         if self._is_numerical_answer_expected:
             self.log("The question expects a numerical answer")
         else:
@@ -271,3 +316,174 @@ class QPM(object):
         :return: true if a numerical question is expected for provided question, otherwise false
         """
         return self._is_numerical_answer_expected
+
+    def result(self):
+        """
+        :return: immutable QPMResult snapshot of this module's results, to be cached or passed to other processes
+        """
+        return QPMResult(free_text=self._free_text,
+                         labeled_answer=self._labeled_answer,
+                         query=self._query,
+                         pos_tags=self._pos_tags,
+                         ner_tags=self._ner_tags,
+                         entities=self._entities,
+                         verbs=self._verbs,
+                         nouns=self._nouns,
+                         important_query_terms=self._important_query_terms,
+                         question_type=self._question_type,
+                         numerical_answer_expected=self._is_numerical_answer_expected)
+
+
+class QPMResult(object):
+    """
+        Immutable snapshot of the results of QPM. It can be pickled and round-tripped through JSON, and it has the
+        accessors of QPM used by the downstream modules, so FMQFM and DSOEM accept it in place of a QPM instance.
+    """
+    __slots__ = ('_free_text', '_labeled_answer', '_query', '_pos_tags', '_ner_tags', '_entities', '_verbs', '_nouns',
+                 '_important_query_terms', '_question_type', '_is_numerical_answer_expected')
+
+    def __init__(self, free_text, labeled_answer="", query="", pos_tags=(), ner_tags=(), entities=(), verbs=(),
+                 nouns=(), important_query_terms=(), question_type=QuestionType.Unclassified,
+                 numerical_answer_expected=False):
+        """
+        :param free_text: user question without the ? character
+        :param labeled_answer: labeled answer of the question, if any
+        :param query: question without stop words
+        :param pos_tags: (token, POS tag) pairs of the question
+        :param ner_tags: (token, NER tag) pairs of the question
+        :param entities: (named entity, NER tag) pairs of the question
+        :param verbs: lower-cased verbs of the question
+        :param nouns: lower-cased nouns of the question
+        :param important_query_terms: lower-cased noun phrases of the question
+        :param question_type: QuestionType of the question
+        :param numerical_answer_expected: whether the question expects a numerical answer
+        """
+        def pairs(tagged):
+            return tuple(tuple(t) for t in tagged) if tagged else ()
+
+        set_slot = super(QPMResult, self).__setattr__
+        set_slot('_free_text', free_text)
+        set_slot('_labeled_answer', labeled_answer)
+        set_slot('_query', query)
+        set_slot('_pos_tags', pairs(pos_tags))
+        set_slot('_ner_tags', pairs(ner_tags))
+        set_slot('_entities', pairs(entities))
+        set_slot('_verbs', tuple(verbs))
+        set_slot('_nouns', tuple(nouns))
+        set_slot('_important_query_terms', tuple(important_query_terms))
+        set_slot('_question_type', question_type)
+        set_slot('_is_numerical_answer_expected', bool(numerical_answer_expected))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("QPMResult is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("QPMResult is immutable")
+
+    def __reduce__(self):
+        return QPMResult, self._values()
+
+    def __eq__(self, other):
+        return isinstance(other, QPMResult) and self._values() == other._values()
+
+    def __hash__(self):
+        return hash(self._values())
+
+    def __repr__(self):
+        return "QPMResult({!r})".format(self._free_text)
+
+    def _values(self):
+        """
+        :return: constructor arguments of this result, in order
+        """
+        return (self._free_text, self._labeled_answer, self._query, self._pos_tags, self._ner_tags, self._entities,
+                self._verbs, self._nouns, self._important_query_terms, self._question_type,
+                self._is_numerical_answer_expected)
+
+    def to_dict(self):
+        """
+        :return: JSON serializable dictionary of this result
+        """
+        return {
+            'question': self._free_text,
+            'labeled_answer': self._labeled_answer,
+            'query': self._query,
+            'pos_tags': self._pos_tags,
+            'ner_tags': self._ner_tags,
+            'entities': self._entities,
+            'verbs': self._verbs,
+            'nouns': self._nouns,
+            'important_query_terms': self._important_query_terms,
+            'question_type': self._question_type.name,
+            'numerical_answer_expected': self._is_numerical_answer_expected,
+        }
+
+    @staticmethod
+    def from_dict(data):
+        """
+        :param data: dictionary created by QPMResult.to_dict
+        :return: QPMResult
+        """
+        return QPMResult(free_text=data['question'],
+                         labeled_answer=data.get('labeled_answer', ""),
+                         query=data['query'],
+                         pos_tags=data['pos_tags'],
+                         ner_tags=data['ner_tags'],
+                         entities=data['entities'],
+                         verbs=data['verbs'],
+                         nouns=data['nouns'],
+                         important_query_terms=data['important_query_terms'],
+                         question_type=QuestionType[data['question_type']],
+                         numerical_answer_expected=data['numerical_answer_expected'])
+
+    def to_json(self):
+        """
+        :return: this result as a JSON string
+        """
+        return json.dumps(self.to_dict())
+
+    @staticmethod
+    def from_json(text):
+        """
+        :param text: JSON string created by QPMResult.to_json
+        :return: QPMResult
+        """
+        return QPMResult.from_dict(json.loads(text))
+
+    def pos_tags(self):
+        return self._pos_tags
+
+    def ner_tags(self):
+        return self._ner_tags
+
+    def important_query_terms(self):
+        return self._important_query_terms
+
+    def query_verbs(self):
+        return self._verbs
+
+    def query_nouns(self):
+        return self._nouns
+
+    @property
+    def question_type(self):
+        return self._question_type
+
+    @property
+    def question_named_entities(self):
+        return self._entities
+
+    def query(self):
+        return self._query
+
+    def free_text(self):
+        return self._free_text
+
+    def labeled_answer(self):
+        return self._labeled_answer
+
+    def stop_words(self):
+        return question_stop_words()
+
+    def is_numerical_answer_expected(self):
+        return self._is_numerical_answer_expected
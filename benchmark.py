@@ -0,0 +1,644 @@
+"""
+Benchmarks for the FQAKG pipeline modules
+
+Package: fqakg
+
+Usage:
+    python3 benchmark.py --bench=taggers --questions=questions.txt [--backends=stanford-server,nltk]
+    python3 benchmark.py --bench=startup
+    python3 benchmark.py --bench=rewrite [--questions=questions.txt]
+    python3 benchmark.py --bench=scanners
+    python3 benchmark.py --bench=query-yield --query-log=queries.jsonl [--pruning=defer]
+    python3 benchmark.py --bench=concurrency [--latency=300] [--concurrency=4]
+    python3 benchmark.py --bench=paging [--latency=300]
+    python3 benchmark.py --bench=streaming [--latency=300] [--work=20]
+    python3 benchmark.py --bench=checks
+"""
+import argparse
+import itertools
+import statistics
+import subprocess
+import sys
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--bench', dest='bench', required=True, help="Benchmark to run (taggers, startup, rewrite, scanners, query-yield, "
+                                                          "concurrency, paging, streaming, checks)")
+parser.add_argument('--questions', dest='questions', required=False, help="File with one question per line")
+parser.add_argument('--backends', dest='backends', required=False, default="stanford-server,stanford,nltk",
+                    help="Comma separated list of tagger backends to compare, the first one is the reference")
+parser.add_argument('--query-log', dest='query_log', required=False,
+                    help="Query outcomes logged by DSOEM (DSOEM.QUERY_LOG_FILE) with query pruning off")
+parser.add_argument('--pruning', dest='pruning', required=False, default="skip",
+                    help="Query pruning policy to replay, 'skip' (default) or 'defer'")
+parser.add_argument('--latency', dest='latency', required=False, type=int, default=300,
+                    help="Latency in ms injected by the stub search server")
+parser.add_argument('--work', dest='work', required=False, type=float, default=20,
+                    help="CPU time in ms spent on each object collected by the streaming benchmark")
+parser.add_argument('--concurrency', dest='concurrency', required=False, type=int,
+                    help="Number of concurrent search queries, default is DSOEM.MAX_CONCURRENT_QUERIES")
+
+args = parser.parse_args()
+
+
+def read_questions(path):
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() != ""]
+
+
+def report_latency(name, samples):
+    """
+    prints latency statistics of the given samples (in seconds)
+    """
+    samples_ms = sorted(s * 1000 for s in samples)
+    p95 = samples_ms[min(len(samples_ms) - 1, int(len(samples_ms) * 0.95))]
+    print("{:<20} n={:<6} mean={:8.2f}ms  p50={:8.2f}ms  p95={:8.2f}ms  max={:8.2f}ms".format(
+        name, len(samples_ms), statistics.mean(samples_ms), statistics.median(samples_ms), p95, samples_ms[-1]))
+
+
+def agreement(reference, other):
+    """
+    :return: fraction of tokens that got the same tag from both taggers, only sentences with identical tokens are compared
+    """
+    same = 0
+    total = 0
+    for ref_tags, other_tags in zip(reference, other):
+        if [t[0] for t in ref_tags] != [t[0] for t in other_tags]:
+            continue
+        total += len(ref_tags)
+        same += sum(1 for r, o in zip(ref_tags, other_tags) if r[1] == o[1])
+    if total == 0:
+        return 0.0
+    return same / total
+
+
+def bench_taggers(questions, backends):
+    from QPM import QPM
+    from qa_utils import KGQAPOSTagger
+
+    # measure the taggers, not the tag cache
+    KGQAPOSTagger.TAG_CACHE_SIZE = 0
+
+    results = {}
+    for backend in backends:
+        tagger = KGQAPOSTagger(backend)
+        sentences = [QPM.first_q(q) for q in questions]
+
+        # the first call includes backend startup (e.g. JVM and model loading), report it separately
+        start = time.perf_counter()
+        tagger.tag(sentences[0])
+        startup = time.perf_counter() - start
+
+        latencies = []
+        tags = []
+        for sentence in sentences:
+            start = time.perf_counter()
+            tags.append(tagger.tag(sentence))
+            latencies.append(time.perf_counter() - start)
+
+        print("[{}] first call: {:.2f}ms".format(backend, startup * 1000))
+        report_latency(backend, latencies)
+        results[backend] = tags
+
+    reference = backends[0]
+    for backend in backends[1:]:
+        pos_agreement = agreement([t[0] for t in results[reference]], [t[0] for t in results[backend]])
+        ner_agreement = agreement([t[1] for t in results[reference]], [t[1] for t in results[backend]])
+        print("{} vs {}: POS agreement {:.2%}, NER agreement {:.2%}".format(reference, backend, pos_agreement,
+                                                                           ner_agreement))
+
+
+def bench_startup():
+    """
+    measures import time of each pipeline module in a fresh interpreter, and the cost of the first tagging call
+    (which builds the taggers) separately
+    """
+    for module in ["qa_utils", "QPM", "FMQFM", "DSOEM", "FAESM"]:
+        code = "import time; start = time.perf_counter(); import {}; print(time.perf_counter() - start)".format(module)
+        output = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, check=True).stdout
+        print("import {:<10} {:8.2f}ms".format(module, float(output.decode().split()[-1]) * 1000))
+
+    from qa_utils import KGQAPOSTagger
+    start = time.perf_counter()
+    KGQAPOSTagger().tag("How tall is Mount McKinley")
+    print("first tag() call  {:8.2f}ms ({} backend)".format((time.perf_counter() - start) * 1000,
+                                                            KGQAPOSTagger.BACKEND))
+
+
+def synthetic_questions(count):
+    """
+    :return: list of generated factoid questions covering all question rewrite rules
+    """
+    starts = ["When were", "when is", "How long is", "how long does", "How long", "How fast", "how tall", "How much",
+              "How often does", "how high are", "How big was", "What is the name of", "Who", "Where is", "How old is"]
+    subjects = ["the pyramids built", "the Nile river", "a cheetah run", "Mount McKinley", "the Eiffel Tower",
+                "the capital of France", "a blue whale weigh", "the U.S.A. founded", "Halley's comet appear"]
+    generated = itertools.cycle("{} {} {}".format(start, subject, i) for i, (start, subject) in
+                                enumerate(itertools.product(starts, subjects)))
+    return list(itertools.islice(generated, count))
+
+
+def bench_rewrite(questions):
+    """
+    compares the compiled single-pass question rewrite (FactoidQueryParser rule tables, QPM numerical answer
+    prefixes) with applying the same rules one str.replace / str.startswith call at a time
+    """
+    from FMQFM import FactoidQueryParser
+    from QPM import QPM
+    from qa_utils import KGQAPhraseRewriter
+
+    rules = FactoidQueryParser.ANSWER_FORM_RULES + FactoidQueryParser.MEASURE_RULES
+    sequential_rules = []
+    for phrase, replacement in rules:
+        sequential_rules.append((phrase, replacement))
+        if phrase[:1].islower():
+            sequential_rules.append((phrase[:1].upper() + phrase[1:], replacement))
+
+    def sequential_rewrite(text):
+        for phrase, replacement in sequential_rules:
+            text = text.replace(phrase, replacement)
+        return text
+
+    def sequential_numerical(text):
+        expected = False
+        for prefix in QPM.NUMERICAL_ANSWER_PREFIXES:
+            expected = expected | text.lower().startswith(prefix)
+        return expected
+
+    rewriter = KGQAPhraseRewriter(rules)
+
+    start = time.perf_counter()
+    sequential = [(sequential_rewrite(q), sequential_numerical(q)) for q in questions]
+    sequential_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compiled = [(rewriter.rewrite(q), q.lower().startswith(QPM.NUMERICAL_ANSWER_PREFIXES)) for q in questions]
+    compiled_time = time.perf_counter() - start
+
+    if sequential != compiled:
+        raise Exception("compiled rewrite output differs from sequential rewrite")
+
+    print("questions:   {}".format(len(questions)))
+    print("sequential:  {:8.2f}ms".format(sequential_time * 1000))
+    print("single-pass: {:8.2f}ms".format(compiled_time * 1000))
+    print("speed-up:    {:8.2f}x".format(sequential_time / compiled_time))
+
+
+def quadratic_quoted_text(text, quoted_token):
+    """
+    the character by character quoted text scanner FactoidQueryParser._process_quoted_text used to have, kept as the
+    reference output
+    :return: (processed text, list of quotes)
+    """
+    quotes = []
+    processed_query = ''
+    potential_quote = ''
+    potential_quote_started = False
+    prev_c = ''
+    for index, c in enumerate(text):
+        next_char = text[index + 1] if index < len(text) - 1 else ''
+        if c in ['\'', '\"', '`']:
+            if potential_quote_started:
+                if next_char == ' ' or next_char == '':
+                    potential_quote_started = False
+                    quotes.append(potential_quote)
+                    potential_quote = ''
+                    processed_query += quoted_token
+                else:
+                    potential_quote += c
+            elif prev_c == ' ' or prev_c == '' or prev_c == '.':
+                potential_quote_started = True
+            else:
+                processed_query += c
+        elif potential_quote_started:
+            potential_quote += c
+        else:
+            processed_query += c
+        prev_c = c
+    if potential_quote != '':
+        processed_query += potential_quote
+    return (processed_query if processed_query != '' else text), quotes
+
+
+def quadratic_dots(text, dot_token):
+    """
+    the dot replacement FactoidQueryParser._process_dots used to have (rebuilding the text for every dot), kept as the
+    reference output
+    """
+    dot_indexes = [i for i, c in enumerate(text) if c == '.' and (i == 0 or text[i - 1] != ' ')]
+    adjustment = 0
+    for h in dot_indexes:
+        dot_pos = h + adjustment
+        text = text[:dot_pos] + dot_token + text[dot_pos + 1:]
+        adjustment += len(dot_token) - 1
+    return text
+
+
+def bench_scanners():
+    """
+    checks that the quoted text and dot scanners of FactoidQueryParser give the reference output and scale linearly
+    with the question size (10 KB question, 500 dots and multiples of them)
+    """
+    import random
+    from FMQFM import FactoidQueryParser
+
+    parser = FactoidQueryParser()
+
+    def scan(text):
+        parser._parsed_query = text
+        parser._process_quoted_text()
+        quoted = (parser._parsed_query, parser._quotes)
+        parser._parsed_query = text
+        parser._process_dots()
+        return quoted, parser._parsed_query
+
+    def reference(text):
+        return (quadratic_quoted_text(text, FactoidQueryParser.QUOTED_TOKEN),
+                quadratic_dots(text, FactoidQueryParser.DOT_TOKEN))
+
+    # random inputs built from the characters the scanners care about
+    rand = random.Random(0)
+    for _ in range(20000):
+        text = "".join(rand.choice("ab .'\"`") for _ in range(rand.randint(0, 12)))
+        if scan(text) != reference(text):
+            raise Exception("scanner output differs from the reference for {!r}".format(text))
+
+    words = ["the", "U.S.A.", "'blue whale'", "Mr.", "\"Yesterday\"", "river", "e.g.", "don't", "`quoted`", "x"]
+    question = " ".join(words[i % len(words)] for i in range(10240 // 6))[:10240]
+    dots = "U." * 250
+
+    for name, text in [("10 KB question", question), ("500 dots", dots)]:
+        if scan(text) != reference(text):
+            raise Exception("scanner output differs from the reference for the {}".format(name))
+
+        timings = []
+        for factor in [1, 2, 4, 8]:
+            sample = text * factor
+            best = min(timeit_once(lambda: scan(sample)) for _ in range(5))
+            reference_time = timeit_once(lambda: reference(sample))
+            timings.append(best)
+            print("{:<15} x{}  single-pass {:8.3f}ms  reference {:8.3f}ms".format(name, factor, best * 1000,
+                                                                               reference_time * 1000))
+
+        # linear scaling: 8 times the input may take at most 3 times longer than 8 times the smallest input
+        if timings[-1] > timings[0] * 8 * 3:
+            raise Exception("{} scanners do not scale linearly".format(name))
+
+
+def bench_query_yield(path, policy):
+    """
+    replays the query outcomes logged by DSOEM, in order, deciding which queries to send with the pruning policy and the
+    yield statistics learned from the queries sent so far. Reports the search API calls saved and the valid objects
+    lost compared to sending the queries in rank order
+    """
+    import json
+    from DSOEM import DSOEM, QueryYieldStats
+
+    with open(path, encoding='utf-8') as f:
+        runs = [json.loads(line) for line in f if line.strip() != ""]
+
+    def replay(run_policy):
+        stats = QueryYieldStats()
+        calls = 0
+        objects = 0
+        latency = 0.0
+        for run in runs:
+            queries = run['queries']
+            order, low_yield = stats.plan([q['type'] for q in queries], run['shape'], run_policy,
+                                          DSOEM.QUERY_MIN_CALLS, DSOEM.QUERY_MIN_YIELD, DSOEM.QUERY_EXPLORE_EVERY)
+            collected = 0
+            for index in order:
+                if collected >= run['max_objects']:
+                    break
+                query = queries[index]
+                added = min(query['objects'], run['max_objects'] - collected)
+                stats.record(query['type'], run['shape'], added, query['latency'])
+                collected += added
+                calls += 1
+                latency += query['latency']
+            objects += collected
+        return calls, objects, latency, stats
+
+    baseline_calls, baseline_objects, baseline_latency, stats = replay(None)
+    calls, objects, latency, _ = replay(policy)
+
+    for line in stats.report():
+        print(line)
+    print("")
+    print("questions:       {}".format(len(runs)))
+    print("API calls:       {} (rank order) -> {} ({} policy), {} saved ({:.1%})".format(
+        baseline_calls, calls, policy, baseline_calls - calls,
+        (baseline_calls - calls) / baseline_calls if baseline_calls else 0.0))
+    print("valid objects:   {} -> {}".format(baseline_objects, objects))
+    print("query latency:   {:.2f}s -> {:.2f}s".format(baseline_latency, latency))
+
+
+def stub_dsoem_questions(latency, corpus=None):
+    """
+    starts a stub server (see data_source.stub_server) with the given latency (in ms) and corpus (the synthetic one if
+    None) and points the Diffbot client to it
+    :return: the server, and a function collecting the objects of 5 questions with 4 search queries each, given the
+             number of concurrent queries, the page size, whether the objects are streamed, the CPU time in seconds
+             spent on each object once collected and the number of streamed objects consumed before the others are
+             collected (all if None). It returns the time per question, the objects and the retrieval statistics of
+             each question
+    """
+    from DSOEM import DSOEM
+    from QPM import QPMResult
+    from data_source.sfsu_diffbot.client import Client
+    from data_source.stub_server import StubServer
+    from qa_logging import configure_logging
+
+    class Multiqueries(object):
+        def __init__(self, queries):
+            self._queries = queries
+
+        def multiquery(self):
+            return self._queries
+
+    server = StubServer(corpus, latency=latency).start()
+    Client.set_end_point(server.url())
+    DSOEM.QUERY_PRUNING = None
+    configure_logging(level="warning")
+
+    questions = []
+    for i in range(5):
+        qpm = QPMResult.from_dict({'question': "Where is landmark {}?".format(i), 'query': "landmark {}".format(i),
+                                   'pos_tags': [], 'ner_tags': [], 'entities': [], 'verbs': [], 'nouns': [],
+                                   'important_query_terms': [], 'question_type': "Unclassified",
+                                   'numerical_answer_expected': False})
+        queries = [(["landmark {}".format(i), "city"], "Full+", 0), (["landmark {}".format(i)], "Full", 1),
+                   (["landmark"], "POS-based", 2), (["city", str(i)], "Unigrams", 3)]
+        questions.append((qpm, Multiqueries(queries)))
+
+    def work(seconds):
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            pass
+
+    def collect(max_concurrent, page_size, stream=False, work_per_object=0.0, consumed=None):
+        DSOEM.MAX_CONCURRENT_QUERIES = max_concurrent
+        DSOEM.QUERY_PAGE_SIZE = page_size
+        samples = []
+        collected = []
+        retrieval = []
+        for qpm, mqfm in questions:
+            start = time.perf_counter()
+            dsoem = DSOEM(mqfm, kg_instance="dkg", api_key="token", qpm=qpm, stream=stream)
+            for count, _ in enumerate(dsoem.iter_objects() if stream else dsoem.get_data_objects()[1], 1):
+                work(work_per_object)
+                if count == consumed:
+                    break
+            samples.append(time.perf_counter() - start)
+            collected.append([(o[0].url(), o[1]) for o in dsoem.get_data_objects()[1]])
+            retrieval.append(dsoem.retrieval_stats())
+        return samples, collected, retrieval
+
+    return server, collect
+
+
+def bench_concurrency(latency, concurrency):
+    """
+    collects the objects of questions with 4 search queries from a stub search server with injected latency, sending
+    the queries one by one and concurrently, without paging. Reports the time per question and the search API calls
+    sent ahead but not needed, and checks that both collect the same objects
+    """
+    from DSOEM import DSOEM
+
+    if concurrency is None:
+        concurrency = DSOEM.MAX_CONCURRENT_QUERIES
+    server, collect = stub_dsoem_questions(latency)
+    serial_samples, serial_objects, _ = collect(1, None)
+    concurrent_samples, concurrent_objects, concurrent_retrieval = collect(concurrency, None)
+    # let the requests sent ahead but not needed complete before the server stops
+    time.sleep(2 * latency / 1000)
+    server.stop()
+
+    report_latency("serial", serial_samples)
+    report_latency("concurrent ({})".format(concurrency), concurrent_samples)
+    print("objects/question: {:.1f}".format(sum(len(objects) for objects in serial_objects) / len(serial_objects)))
+    print("speedup: {:.2f}x".format(sum(serial_samples) / sum(concurrent_samples)))
+    print("calls sent ahead but not needed/question: {:.2f}".format(
+        -sum(r['calls_saved'] for r in concurrent_retrieval) / len(concurrent_retrieval)))
+    if serial_objects != concurrent_objects:
+        raise Exception("concurrent queries collected different objects")
+
+
+def bench_paging(latency):
+    """
+    collects the objects of questions from a stub search server, asking for the object limit with each query and with
+    adaptive paging, the next query being sent ahead in both cases. Reports the time, search API calls and response bytes
+    per question and checks that both collect the same objects, and that paging doesn't receive more response bytes.
+    Paging trades search API calls (the next pages, and the queries sent ahead but not needed) for response bytes
+    """
+    from DSOEM import DSOEM
+
+    page_size = DSOEM.QUERY_PAGE_SIZE or 10
+    concurrency = DSOEM.MAX_CONCURRENT_QUERIES
+    server, collect = stub_dsoem_questions(latency)
+    full_samples, full_objects, full_retrieval = collect(concurrency, None)
+    paged_samples, paged_objects, paged_retrieval = collect(concurrency, page_size)
+    # let the requests sent ahead but not needed complete before the server stops
+    time.sleep(2 * latency / 1000)
+    server.stop()
+
+    report_latency("object limit", full_samples)
+    report_latency("paging ({})".format(page_size), paged_samples)
+    for name, retrieval in [("object limit", full_retrieval), ("paging ({})".format(page_size), paged_retrieval)]:
+        print("{:<20} API calls/question={:5.2f}  response KB/question={:8.1f}  estimated KB saved/question={:8.1f}".format(
+            name, sum(r['calls'] for r in retrieval) / len(retrieval),
+            sum(r['bytes'] for r in retrieval) / len(retrieval) / 1024,
+            sum(r['bytes_saved'] for r in retrieval) / len(retrieval) / 1024))
+    if full_objects != paged_objects:
+        raise Exception("adaptive paging collected different objects")
+    if sum(r['bytes'] for r in paged_retrieval) > sum(r['bytes'] for r in full_retrieval):
+        raise Exception("adaptive paging received more response bytes than asking for the object limit")
+
+
+def bench_streaming(latency, work):
+    """
+    collects the objects of questions from a stub search server returning few objects per query, so that all 4 queries
+    are needed, and spends the given CPU time (in ms) on each object, like FAESM building its candidate answer
+    paragraphs. Compares processing the objects once all are collected with streaming them, and checks that both
+    collect the same objects
+    """
+    from DSOEM import DSOEM
+    from data_source.stub_server import StubServer
+
+    concurrency = DSOEM.MAX_CONCURRENT_QUERIES
+    StubServer.RESULTS_PER_QUERY = 10
+    server, collect = stub_dsoem_questions(latency)
+    collected_samples, collected_objects, _ = collect(concurrency, None, False, work / 1000)
+    streamed_samples, streamed_objects, _ = collect(concurrency, None, True, work / 1000)
+    server.stop()
+
+    report_latency("collected", collected_samples)
+    report_latency("streamed", streamed_samples)
+    print("objects/question: {:.1f}".format(sum(len(objects) for objects in collected_objects) /
+                                            len(collected_objects)))
+    print("time saved/question: {:.0f}ms".format(
+        (sum(collected_samples) - sum(streamed_samples)) / len(streamed_samples) * 1000))
+    if collected_objects != streamed_objects:
+        raise Exception("streaming collected different objects")
+
+
+def check_retrieval():
+    """
+    behaviour checks of the DSOEM retrieval against a stub server (see data_source.stub_server) and fixture bundles
+    (see data_source.fixtures): sending queries ahead, adaptive paging, deferred queries, streaming, record/replay, near
+    duplicates and text statistics. Raises an exception on the first failed check
+    """
+    import os
+    import random
+    import tempfile
+    from DSOEM import DSOEM
+    from data_source import data_source_object
+    from data_source.fixtures import FixtureTransport, MissingFixtureError
+    from data_source.sfsu_diffbot.client import Client
+    from data_source.stub_server import StubServer, synthetic_corpus
+
+    def check(passed, name):
+        if not passed:
+            raise Exception("check failed: {}".format(name))
+        print("ok   {}".format(name))
+
+    latency = 5
+    server, collect = stub_dsoem_questions(latency)
+
+    def searches(run):
+        """
+        :return: result of the run, and the number of search requests the server received during it
+        """
+        before = server.stats().get(StubServer.SEARCH, {}).get('requests', 0)
+        result = run()
+        # requests sent ahead but not needed complete in the background
+        time.sleep(4 * latency / 1000)
+        return result, server.stats()[StubServer.SEARCH]['requests'] - before
+
+    def calls(retrieval):
+        return sum(r['calls'] for r in retrieval)
+
+    (_, serial_objects, serial_retrieval), serial_searches = searches(lambda: collect(1, None))
+    check(serial_searches == calls(serial_retrieval), "queries sent one by one are all reported")
+
+    (_, ahead_objects, ahead_retrieval), ahead_searches = searches(lambda: collect(2, None))
+    check(ahead_objects == serial_objects, "sending queries ahead collects the same objects")
+    check(ahead_searches == calls(ahead_retrieval), "queries sent ahead but not needed are reported")
+
+    (_, paged_objects, paged_retrieval), paged_searches = searches(lambda: collect(2, 10))
+    check(paged_objects == serial_objects, "adaptive paging collects the same objects")
+    check(paged_searches == calls(paged_retrieval), "adaptive paging sends no unreported search calls")
+    check(sum(r['bytes'] for r in paged_retrieval) <= sum(r['bytes'] for r in serial_retrieval),
+          "adaptive paging receives no more response bytes")
+
+    (_, streamed_objects, _), streamed_searches = searches(lambda: collect(1, None, stream=True, consumed=5))
+    check(streamed_objects == serial_objects, "a partially consumed stream collects the same objects")
+    check(streamed_searches == serial_searches, "a partially consumed stream sends no search query again")
+
+    # the last two query types are low-yield for the shape of the questions, deferred queries are never sent ahead
+    from QPM import QPMResult
+    qpm = QPMResult.from_dict({'question': "Where is landmark 0?", 'query': "landmark 0", 'pos_tags': [],
+                               'ner_tags': [], 'entities': [], 'verbs': [], 'nouns': [], 'important_query_terms': [],
+                               'question_type': "Unclassified", 'numerical_answer_expected': False})
+    DSOEM._query_stats = None
+    for query_type in ("POS-based", "Unigrams"):
+        for _ in range(DSOEM.QUERY_MIN_CALLS):
+            DSOEM.query_stats().record(query_type, DSOEM.question_shape(qpm), 0, 0.0)
+    pruning, explore_every = DSOEM.QUERY_PRUNING, DSOEM.QUERY_EXPLORE_EVERY
+    DSOEM.QUERY_PRUNING, DSOEM.QUERY_EXPLORE_EVERY = "defer", None
+    (_, deferred_objects, deferred_retrieval), deferred_searches = searches(lambda: collect(4, None))
+    DSOEM.QUERY_PRUNING, DSOEM.QUERY_EXPLORE_EVERY = pruning, explore_every
+    DSOEM._query_stats = None
+    check(deferred_searches == calls(deferred_retrieval) == 2 * len(deferred_retrieval),
+          "deferred low-yield queries are not sent ahead")
+
+    bundle = os.path.join(tempfile.mkdtemp(), "fixtures.json")
+    transport = FixtureTransport(bundle, FixtureTransport.RECORD, data_source="dkg")
+    FixtureTransport.install(transport)
+    _, recorded_objects, _ = collect(1, None)
+    transport.save()
+    transport = FixtureTransport(bundle, FixtureTransport.REPLAY)
+    FixtureTransport.install(transport)
+    (_, replayed_objects, _), replayed_searches = searches(lambda: collect(1, None))
+    check(replayed_objects == recorded_objects and replayed_searches == 0,
+          "replayed responses collect the same objects without requests")
+    try:
+        Client("token").article("https://www.stub.test/unrecorded")
+        missing = False
+    except MissingFixtureError:
+        missing = True
+    check(missing, "a request missing from the fixture bundle fails")
+    FixtureTransport.install(None)
+    server.stop()
+
+    # copies of the documents with valid text on a mirror, reformatted, right after them
+    corpus = []
+    for document in synthetic_corpus():
+        corpus.append(document)
+        if "paragraph" in document['text']:
+            corpus.append(dict(document, pageUrl=document['pageUrl'].replace("www.", "mirror."),
+                               text=document['text'].replace("\n", " \n\n")))
+
+    def copies(objects):
+        """
+        :return: number of documents collected with their copy
+        """
+        urls = {url for url, _ in objects}
+        return sum(1 for url in urls if "mirror." in url and url.replace("mirror.", "www.") in urls)
+
+    server, collect = stub_dsoem_questions(latency, corpus)
+    similarity = DSOEM.NEAR_DUPLICATE_SIMILARITY
+    DSOEM.NEAR_DUPLICATE_SIMILARITY = None
+    _, kept_objects, _ = collect(1, None)
+    DSOEM.NEAR_DUPLICATE_SIMILARITY = 0.95
+    dropped = DSOEM.near_duplicate_documents
+    _, filtered_objects, _ = collect(1, None)
+    DSOEM.NEAR_DUPLICATE_SIMILARITY = similarity
+    server.stop()
+    check(sum(copies(objects) for objects in kept_objects) > 0 and
+          sum(copies(objects) for objects in filtered_objects) == 0 and DSOEM.near_duplicate_documents > dropped,
+          "near-duplicate documents are dropped when enabled")
+
+    rng = random.Random(0)
+    chunk_size = data_source_object.TEXT_STATS_CHUNK_SIZE
+    data_source_object.TEXT_STATS_CHUNK_SIZE = 7
+    texts = ["".join(rng.choice("ab .\n\t") for _ in range(rng.randint(0, 80))) for _ in range(2000)]
+    stats = [data_source_object.text_stats(text) for text in texts]
+    data_source_object.TEXT_STATS_CHUNK_SIZE = chunk_size
+    check(all(s.tokens == len(text.split()) and s.lines == text.count("\n") for s, text in zip(stats, texts)),
+          "text statistics count the tokens across chunk boundaries")
+
+
+def timeit_once(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+if args.bench == "taggers":
+    if args.questions is None:
+        raise Exception("questions file required for taggers benchmark (see help)")
+    bench_taggers(read_questions(args.questions), args.backends.split(","))
+elif args.bench == "startup":
+    bench_startup()
+elif args.bench == "rewrite":
+    if args.questions is None:
+        bench_rewrite(synthetic_questions(200000))
+    else:
+        bench_rewrite(read_questions(args.questions))
+elif args.bench == "scanners":
+    bench_scanners()
+elif args.bench == "query-yield":
+    if args.query_log is None:
+        raise Exception("query log required for query-yield benchmark (see help)")
+    bench_query_yield(args.query_log, args.pruning)
+elif args.bench == "concurrency":
+    bench_concurrency(args.latency, args.concurrency)
+elif args.bench == "paging":
+    bench_paging(args.latency)
+elif args.bench == "streaming":
+    bench_streaming(args.latency, args.work)
+elif args.bench == "checks":
+    check_retrieval()
+else:
+    print("Unrecognized benchmark")
@@ -0,0 +1,58 @@
+"""
+Generates the verb inflections table used by KGQAPastTense (data/past_tense_verbs.tsv) from pattern.en's verb lexicon,
+so that FMQFM doesn't need to import pattern at runtime
+
+Package: fqakg
+
+Usage:
+    python3 build_past_tense_table.py [--output=data/past_tense_verbs.tsv]
+"""
+import argparse
+
+from pattern.en import conjugate, lexeme, verbs, PAST, SG
+
+from qa_utils import KGQAPastTense
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--output', dest='output', required=False, default=KGQAPastTense.TABLE_FILE,
+                    help="Path of the generated table")
+
+args = parser.parse_args()
+
+HEADER = ("# Verb inflections, one verb per line: infinitive, 3rd person singular, present participle, past (3rd person\n"
+          "# singular), past participle and any other forms. Generated by build_past_tense_table.py\n")
+
+# rows replacing or adding to pattern's: verbs its lexicon gets wrong (it has 'bited') or misses, which it would
+# conjugate with its regular rules ('binded', 'layed'). 'found' is listed so that it isn't taken for the past of 'find'
+OVERRIDES = {
+    "bind": ["bind", "binds", "binding", "bound", "bound"],
+    "bite": ["bite", "bites", "biting", "bit", "bitten"],
+    "found": ["found", "founds", "founding", "founded", "founded"],
+    "lay": ["lay", "lays", "laying", "laid", "laid"],
+    "program": ["program", "programs", "programming", "programmed", "programmed"],
+    "use": ["use", "uses", "using", "used", "used"],
+}
+
+rows = []
+for infinitive in sorted(set(verbs.infinitives) | set(OVERRIDES)):
+    if infinitive in OVERRIDES:
+        rows.append("\t".join(OVERRIDES[infinitive]))
+        continue
+    # the past column must be what FMQFM used to get from conjugate at runtime
+    forms = [infinitive,
+             conjugate(infinitive, "3sg"),
+             conjugate(infinitive, "part"),
+             conjugate(verb=infinitive, tense=PAST, number=SG),
+             conjugate(infinitive, "ppart")]
+    if None in forms:
+        continue
+    # skip negated forms (e.g. "isn't", "am not")
+    forms += [form for form in lexeme(infinitive) if form not in forms and "'" not in form and " " not in form]
+    rows.append("\t".join(forms))
+
+with open(args.output, "w", encoding="utf-8") as f:
+    f.write(HEADER)
+    for row in rows:
+        f.write(row + "\n")
+
+print("{} verbs written to {}".format(len(rows), args.output))
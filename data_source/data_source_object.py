@@ -1,6 +1,35 @@
+from collections import namedtuple
+
+# number of line breaks and of whitespace separated tokens of a text, and its mean token length (len(text) / tokens)
+TextStats = namedtuple('TextStats', ['lines', 'tokens', 'mean_token_length'])
+
+# number of characters of the text whose tokens are counted at once
+TEXT_STATS_CHUNK_SIZE = 65536
+
+
+def text_stats(text):
+    """
+        computes the statistics of a text, counting its tokens one bounded chunk at a time so that the token list of a
+        whole document is never built, whatever its line lengths
+    :param text: the text, may be None
+    :return: TextStats of the text
+    """
+    if not text:
+        return TextStats(0, 0, 0.0)
+    tokens = 0
+    for start in range(0, len(text), TEXT_STATS_CHUNK_SIZE):
+        chunk = text[start:start + TEXT_STATS_CHUNK_SIZE]
+        tokens += len(chunk.split())
+        # a token spanning the chunk boundary was counted in both chunks
+        if start > 0 and not chunk[0].isspace() and not text[start - 1].isspace():
+            tokens -= 1
+    return TextStats(text.count("\n"), tokens, len(text) / tokens if tokens > 0 else 0.0)
+
+
 class DataSourceObject:
     def __init__(self, obj_with_fields):
         self._object = obj_with_fields
+        self._text_stats = None
 
     def object_value(self, field):
         """
@@ -9,4 +38,13 @@ class DataSourceObject:
         :return: the value of the field
         """
         if field in self._object:
-            return self._object[field]
\ No newline at end of file
+            return self._object[field]
+
+    def text_stats(self):
+        """
+
+        :return: TextStats of the object's text, computed once
+        """
+        if self._text_stats is None:
+            self._text_stats = text_stats(self.text() if hasattr(self, 'text') else None)
+        return self._text_stats
@@ -0,0 +1,168 @@
+"""
+Record/replay transport of the data source clients (Diffbot Client and GKGAPI).
+
+In record mode every HTTP GET of the clients is sent and its response is captured into a fixture bundle, a versioned
+JSON file. In replay mode the responses are served from the bundle, with optional injected latency, so that modules 3
+and 4 run offline and reproducibly. API tokens and keys are never written to the bundle, nor used to look responses up.
+
+Package: fqakg
+
+Usage:
+    transport = FixtureTransport("fixtures.json", FixtureTransport.RECORD, data_source="dkg")
+    FixtureTransport.install(transport)
+    ... run the pipeline ...
+    transport.save()
+"""
+import json
+import os
+import random
+import threading
+import time
+
+from qa_logging import get_logger
+
+logger = get_logger("DSOEM.Fixtures")
+
+
+class MissingFixtureError(Exception):
+    """
+    raised when a replayed request was not recorded
+    """
+    pass
+
+
+class FixtureTransport(object):
+    """
+    Transport of the data source clients which records responses into a fixture bundle or replays them
+    """
+    RECORD = "record"
+    REPLAY = "replay"
+
+    # version of the fixture bundle format
+    VERSION = 1
+    # request parameters holding credentials, not recorded
+    SECRET_PARAMS = ('token', 'key')
+
+    def __init__(self, path, mode, data_source=None, latency=None):
+        """
+        :param path: path of the fixture bundle, loaded if it exists (recording adds to it)
+        :param mode: RECORD or REPLAY
+        :param data_source: data source of the recorded requests ('dkg' or 'gkg'), stored in the bundle
+        :param latency: replay latency: None (no latency), "recorded" (the latency of each recorded response), or a
+                        number of milliseconds, or "min-max" to draw it uniformly between min and max milliseconds
+        """
+        if mode not in (FixtureTransport.RECORD, FixtureTransport.REPLAY):
+            raise Exception("Unrecognized fixture transport mode {}".format(mode))
+
+        self._path = path
+        self._mode = mode
+        self._latency = latency
+        self._lock = threading.Lock()
+        self._bundle = {'version': FixtureTransport.VERSION, 'data_source': data_source, 'responses': {}}
+        self.replayed = 0
+        self.recorded = 0
+
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                bundle = json.load(f)
+            if bundle.get('version') != FixtureTransport.VERSION:
+                raise Exception("Fixture bundle {} has version {}, version {} is supported".format(
+                    path, bundle.get('version'), FixtureTransport.VERSION))
+            if data_source is not None and bundle.get('data_source') not in (None, data_source):
+                raise Exception("Fixture bundle {} was recorded with data source {}".format(
+                    path, bundle['data_source']))
+            bundle['data_source'] = bundle.get('data_source') or data_source
+            self._bundle = bundle
+        elif mode == FixtureTransport.REPLAY:
+            raise Exception("Fixture bundle {} not found".format(path))
+
+    @staticmethod
+    def install(transport):
+        """
+            routes the requests of the data source clients through the transport, None restores direct requests. A
+            recording transport disables the Diffbot requests cache, whose responses would be recorded with its latency
+        :param transport: FixtureTransport or None
+        :return: None
+        """
+        from data_source.sfsu_diffbot.client import Client
+        from data_source.google_kg_client.GKGAPI import GKGAPI
+        if transport is not None and transport._mode == FixtureTransport.RECORD:
+            Client.disable_cache()
+        Client.transport = transport
+        GKGAPI.transport = transport
+
+    @staticmethod
+    def key(endpoint, params):
+        """
+        :param endpoint: URL of the request, without query string
+        :param params: request parameters
+        :return: key of the request in the bundle, which doesn't include the credentials
+        """
+        params = sorted((str(name), str(value)) for name, value in params.items()
+                        if name not in FixtureTransport.SECRET_PARAMS)
+        return json.dumps([endpoint, params])
+
+    def data_source(self):
+        """
+        :return: data source the bundle was recorded with
+        """
+        return self._bundle['data_source']
+
+    def get(self, endpoint, params, send):
+        """
+            records or replays a request
+        :param endpoint: URL of the request, without query string
+        :param params: request parameters
+        :param send: function sending the request, returning the response body (bytes)
+        :return: the response body (bytes)
+        """
+        key = FixtureTransport.key(endpoint, params)
+        if self._mode == FixtureTransport.RECORD:
+            start = time.perf_counter()
+            body = send()
+            latency = time.perf_counter() - start
+            text = body.decode('utf-8')
+            # responses may echo the request
+            for name in FixtureTransport.SECRET_PARAMS:
+                if params.get(name):
+                    text = text.replace(str(params[name]), "")
+            with self._lock:
+                self._bundle['responses'][key] = {'body': text, 'latency': latency}
+                self.recorded += 1
+            return body
+
+        with self._lock:
+            response = self._bundle['responses'].get(key)
+            self.replayed += 1
+        if response is None:
+            raise MissingFixtureError("No recorded response for {}".format(key))
+        delay = self._delay(response)
+        if delay > 0:
+            time.sleep(delay)
+        return response['body'].encode('utf-8')
+
+    def _delay(self, response):
+        """
+        :return: replay latency of a response in seconds
+        """
+        if self._latency is None:
+            return 0.0
+        if self._latency == "recorded":
+            return response['latency']
+        if isinstance(self._latency, str) and "-" in self._latency:
+            low, high = self._latency.split("-", 1)
+            return random.uniform(float(low), float(high)) / 1000
+        return float(self._latency) / 1000
+
+    def save(self):
+        """
+            writes the fixture bundle (record mode)
+        :return: None
+        """
+        if self._mode != FixtureTransport.RECORD:
+            return
+        with self._lock:
+            with open(self._path, "w", encoding='utf-8') as f:
+                json.dump(self._bundle, f, indent=1, sort_keys=True)
+            logger.info("%s responses recorded to %s (%s in total)", self.recorded, self._path,
+                        len(self._bundle['responses']))
@@ -1,20 +1,37 @@
 import json
+import logging
 import urllib
 import urllib.parse
 import urllib.request
 from googleapiclient.discovery import build
 from data_source.google_kg_client.GKG_Content import *
+from data_source.fixtures import MissingFixtureError
 
 from colorama import init
 init() # colorama needed for Windows
 from colorama import Fore, Back, Style
+from qa_logging import Highlight, get_logger
+
+logger = get_logger("DSOEM.GKGAPI")
 
 class GKGAPI(object):
+    SEARCH_END_POINT = 'https://kgsearch.googleapis.com/v1/entities:search'
+    # optional transport recording or replaying the requests (see data_source.fixtures.FixtureTransport)
+    transport = None
+
     def __init__(self, api_key, queries= None):
         self._key = api_key
         self._queries = queries
         self.Q_COLOR = Fore.CYAN
 
+    @staticmethod
+    def set_end_point(url):
+        """
+            points the clients to another Google KG server, e.g. a local stub server (see data_source.stub_server)
+        :param url: the server url, e.g. http://127.0.0.1:8900
+        """
+        GKGAPI.SEARCH_END_POINT = url + "/v1/entities:search"
+
     def client(self):
         return self.getService()
 
@@ -52,31 +69,38 @@ class GKGAPI(object):
 
     def boolean_search(self, query, limit=10, entitiy_type=None):
         tags = []
-        self._service_url = 'https://kgsearch.googleapis.com/v1/entities:search'
-        self._params = {'query': query, 'limit': limit, 'indent': True, 'key': self._key}
+        response = {'itemListElement': []}
+        # request state is local, so that concurrent searches don't share it
+        service_url = GKGAPI.SEARCH_END_POINT
+        params = {'query': query, 'limit': limit, 'indent': True, 'key': self._key}
 
         # named entity search
         if entitiy_type != None:
-            self._params['types'] = entitiy_type
+            params['types'] = entitiy_type
+
+        def send():
+            # noinspection PyUnresolvedReferences
+            url = service_url + '?' + urllib.parse.urlencode(params)
+            return urllib.request.urlopen(url).read()
 
-        # noinspection PyUnresolvedReferences
-        self._url = self._service_url + '?' + urllib.parse.urlencode(self._params)
         try:
-            response = json.loads(urllib.request.urlopen(self._url).read())
-        except:
+            if GKGAPI.transport is not None:
+                response = json.loads(GKGAPI.transport.get(service_url, params, send))
+            else:
+                response = json.loads(send())
+        except MissingFixtureError:
+            raise
+        except Exception as e:
+            self.log("Google KG search failed: %s", e, level=logging.WARNING)
             return GoogleKGContent(response)
         return GoogleKGContent(response)
 
-    def log(self, text):
-        print("[{}] {}".format("DSOEM", text))
+    def log(self, text, *args, level=logging.INFO):
+        logger.log(level, text, *args)
 
     def simple_search(self, query):
-        self.log(
-            "Using Google KG Search API (https://kgsearch.googleapis.com/v1/entities:search) for boolean query {}{}{}{}".format(
-                self.Q_COLOR,
-                Style.BRIGHT,
-                query,
-                Style.RESET_ALL))
+        self.log("Using Google KG Search API (%s) for boolean query %s", GKGAPI.SEARCH_END_POINT,
+                 Highlight(query, self.Q_COLOR))
 
         return self.boolean_search(query)
 
@@ -84,13 +108,8 @@ class GKGAPI(object):
     def kg_search(self, named_entity):
         objs = []
 
-        self.log(
-            "Using Google KG Search API (https://kgsearch.googleapis.com/v1/entities:search) for named entity {}{}{}{} of type {}".format(
-                self.Q_COLOR,
-                Style.BRIGHT,
-                named_entity[0],
-                Style.RESET_ALL,
-                named_entity[1]))
+        self.log("Using Google KG Search API (%s) for named entity %s of type %s", GKGAPI.SEARCH_END_POINT,
+                 Highlight(named_entity[0], self.Q_COLOR), named_entity[1])
 
         # TODO: implement KG search with Google API
         return objs
@@ -1,4 +1,9 @@
+import logging
+
 from data_source.data_source_object import *
+from qa_logging import get_logger
+
+logger = get_logger("DSOEM.GKG_Content")
 
 
 class GoogleKGObject(DataSourceObject):
@@ -29,8 +34,8 @@ class GoogleKGContent:
                 objs.append(GoogleKGObject({"text": element['result']['detailedDescription']['articleBody'],
                                             "url": element['result']['detailedDescription']['url'],
                              "score": element['resultScore'], "name": element['result']['name']}))
-                self.log("   candidate {}: {}".format(index, element['result']['detailedDescription']['articleBody']))
+                self.log("   candidate %s: %s", index, element['result']['detailedDescription']['articleBody'])
         return objs
 
-    def log(self, text):
-        print("[{}] {}".format("DSOEM", text))
\ No newline at end of file
+    def log(self, text, *args, level=logging.INFO):
+        logger.log(level, text, *args)
@@ -33,7 +33,9 @@ from data_source.sfsu_diffbot.content import Content
 from data_source.sfsu_diffbot.diffbot_apis import DiffbotApi
 from data_source.sfsu_diffbot.crawlbot import CrawlBot
 from data_source.sfsu_diffbot.crawlbot_actions import CrawlbotActions
+from data_source.fixtures import MissingFixtureError
 import requests_cache
+import threading
 import time
 
 class Client(object):
@@ -47,11 +49,16 @@ class Client(object):
     DIFFBOT_END_POINT = "https://api.diffbot.com"
     DIFFBOT_KG_API_END_POINT = "http://kg.diffbot.com/kg/dql_endpoint"
     DEBUG_HTTPGET_COUNT = 0
+    _count_lock = threading.Lock()
     requests_cache.install_cache('diffbot_cache')
     #requests_cache.install_cache('diffbot_cache_freebaseqa_eval')
     #requests_cache.install_cache('diffbot_cache_comqa')
 
     _https_session = requests.Session()
+    # sessions of the threads other than the main one, simple_search may be called concurrently
+    _thread_sessions = threading.local()
+    # optional transport recording or replaying the requests (see data_source.fixtures.FixtureTransport)
+    transport = None
 
     def __init__(self, token, version = "v3", output_format="json"):
         """
@@ -82,6 +89,64 @@ class Client(object):
         logging.basicConfig(level=logging.INFO,
                             format='%(asctime)s %(levelname)s %(message)s')
 
+    @staticmethod
+    def _session():
+        """
+
+        :return: the HTTP session of the calling thread
+        """
+        if threading.current_thread() is threading.main_thread():
+            return Client._https_session
+        session = getattr(Client._thread_sessions, 'session', None)
+        if session is None:
+            session = requests.Session()
+            Client._thread_sessions.session = session
+        return session
+
+    @staticmethod
+    def set_end_point(url):
+        """
+        Points the clients to another Diffbot server, e.g. a local stub server (see data_source.stub_server). The
+        responses of that server are not cached
+        :param url: the server url, e.g. http://127.0.0.1:8900
+        :return: VOID
+        """
+        Client.DIFFBOT_END_POINT = url
+        Client.DIFFBOT_KG_API_END_POINT = url + "/kg/dql_endpoint"
+        Client.disable_cache()
+
+    @staticmethod
+    def disable_cache():
+        """
+        Sends the requests to the server instead of answering them from the requests cache
+        :return: VOID
+        """
+        requests_cache.uninstall_cache()
+        Client._https_session = requests.Session()
+        Client._thread_sessions = threading.local()
+
+    @staticmethod
+    def _get(endpoint, params):
+        """
+        Sends a GET request, through the transport if one is set
+        :param endpoint: the request url
+        :param params: the request parameters
+        :return: the response body
+        """
+        def send():
+            return Client._session().get(endpoint, params=params).content
+
+        if Client.transport is not None:
+            return Client.transport.get(endpoint, params, send)
+        return send()
+
+    @staticmethod
+    def _count_http_get():
+        with Client._count_lock:
+            Client.DEBUG_HTTPGET_COUNT = Client.DEBUG_HTTPGET_COUNT + 1
+            count = Client.DEBUG_HTTPGET_COUNT
+        logging.debug("HTTP GET Count={}".format(count))
+
     def data(self):
         """
 
@@ -309,13 +374,16 @@ class Client(object):
         """
         print(self._params)
 
-    def prepare_kg_request(self, query, param = None, data={'orderBy':'timestamp'}):
+    def prepare_kg_request(self, query, param = None, data={'orderBy':'timestamp'}, params=None):
         """
                 Api that sends a request to the server of type SEARCH
                 :param query: the query
                 :param data: the request attached parameters
+                :param params: the request parameters to fill, the parameters of the client if None
                 :return: the response from the server in json format
                 """
+        if params is None:
+            params = self._params
         endpoint = Client.DIFFBOT_KG_API_END_POINT
         query_builder = ""
 
@@ -330,24 +398,27 @@ class Client(object):
             for key, value in param.items():
                 query_builder += (" " + key + ":" + str(value))
 
-        self._params.update({'query': query_builder})
+        params.update({'query': query_builder})
         #print("Diffbot Query: {}".format(query_builder))
         if data:
             for key, value in data.items():
-                self._params.update({key: value})
+                params.update({key: value})
 
-        self._params.update({"num": "3"})
-        self._params.update({"type": "query"})
+        params.update({"num": "3"})
+        params.update({"type": "query"})
 
         return endpoint
 
-    def prepare_gi_request(self, query, param = None, data={'orderBy':'timestamp'}, search_type=EXACT_MATCH):
+    def prepare_gi_request(self, query, param = None, data={'orderBy':'timestamp'}, search_type=EXACT_MATCH, params=None):
         """
                 Api that sends a request to the server of type SEARCH
                 :param query: the query
                 :param data: the request attached parameters
+                :param params: the request parameters to fill, the parameters of the client if None
                 :return: the response from the server in json format
                 """
+        if params is None:
+            params = self._params
         endpoint = Client.DIFFBOT_END_POINT + "/" + self._version + "/search"
         #endpoint = "http://kg.diffbot.com/kg/dql_endpoint"
         query_builder = ""
@@ -370,13 +441,13 @@ class Client(object):
         if param:
             for key, value in param.items():
                 query_builder += (" " + key + ":" + str(value))
-        self._params.update({'query': query_builder})
+        params.update({'query': query_builder})
         #print("Diffbot Query: {}".format(query_builder))
         if data:
             for key, value in data.items():
-                self._params.update({key: value})
+                params.update({key: value})
 
-        self._params.update({"num": str(self._num_results)})
+        params.update({"num": str(self._num_results)})
         #self._params.update({"type": "query"})
 
         return endpoint
@@ -384,36 +455,55 @@ class Client(object):
     def kg_search(self, named_entity):
         return self.simple_search(named_entity, search_api=self.KG_API)
 
-    def simple_search(self, query, search_api=GLOBAL_INDEX, search_type=EXACT_MATCH, param = None, data={'orderBy':'timestamp'}):
+    def simple_search(self, query, search_api=GLOBAL_INDEX, search_type=EXACT_MATCH, param = None, data={'orderBy':'timestamp'},
+                      num_results=None, start_index=None):
+        """
+        Sends a search request. The request parameters are a copy of the client's ones, so searches can run concurrently
+        on the same client
+        :param query: the query terms, or (name, type) of a named entity for KG_API
+        :param search_api: GLOBAL_INDEX or KG_API
+        :param search_type: EXACT_MATCH or FUZZY_MATCH
+        :param param: extra query fields
+        :param data: extra request parameters
+        :param num_results: number of results of this request, the client's num_results if None
+        :param start_index: index of the first result of this request, the client's start_index if None
+        :return: the response from the server, None if it isn't valid JSON
+        """
+        params = dict(self._params)
         if search_api is self.GLOBAL_INDEX:
-            endpoint = self.prepare_gi_request(query, param, data, search_type)
+            endpoint = self.prepare_gi_request(query, param, data, search_type, params)
         elif search_api is self.KG_API:
-            endpoint = self.prepare_kg_request(query, param, data)
+            endpoint = self.prepare_kg_request(query, param, data, params)
         else:
             Exception("invalide seach api: {}".format(search_api))
             exit(1)
+        if num_results:
+            params.update({"num": str(num_results)})
+        if start_index:
+            params.update({"start": start_index})
 
-        Client.DEBUG_HTTPGET_COUNT = Client.DEBUG_HTTPGET_COUNT + 1
-        logging.debug("HTTP GET Count={}".format(Client.DEBUG_HTTPGET_COUNT))
+        Client._count_http_get()
 
         try:
-            request = Client._https_session.get(endpoint, params=self._params)
-            content = json.loads(request.content.decode('utf-8'))
+            body = Client._get(endpoint, params)
+            content = json.loads(body.decode('utf-8'))
         except Exception as inst:
             if type(inst) == json.decoder.JSONDecodeError:
                 print("JSONDecodeError occurred: {}".format(inst.msg))
                 return None
+            elif isinstance(inst, MissingFixtureError):
+                raise
             else:
                 print("Diffbot connection was reset, trying again in 10 seconds...")
                 time.sleep(10)
                 # try again
-                request = Client._https_session.get(endpoint, params=self._params)
-                content = json.loads(request.content.decode('utf-8'))
+                body = Client._get(endpoint, params)
+                content = json.loads(body.decode('utf-8'))
 
         if 'error' in content:
             self._error = content['error']
             self._error_code = content['errorCode']
-        response = Content(content)
+        response = Content(content, len(body))
 
         # TODO: need to figure out a way to limit the number of returned results similar to GLOBAL_INDEX API.
         # for now, harcoding to using max of 3 objects from returned results
@@ -458,19 +548,21 @@ class Client(object):
         logging.debug("HTTP GET Count={}".format(Client.DEBUG_HTTPGET_COUNT))
 
         try:
-            request = Client._https_session.get(endpoint, params=self._params)
-            content = json.loads(request.content.decode('utf-8'))
+            body = Client._get(endpoint, self._params)
+            content = json.loads(body.decode('utf-8'))
+        except MissingFixtureError:
+            raise
         except:
             print("Diffbot connection was reset, trying again in 10 seconds...")
             time.sleep(10)
             # try again
-            request = Client._https_session.get(endpoint, params=self._params)
-            content = json.loads(request.content.decode('utf-8'))
+            body = Client._get(endpoint, self._params)
+            content = json.loads(body.decode('utf-8'))
 
         if 'error' in content:
             self._error = content['error']
             self._error_code = content['errorCode']
-        response = Content(content)
+        response = Content(content, len(body))
         self._docsInCollection = response.docsInCollection()
         self._query_info = response.query_info()
         return response
@@ -487,26 +579,29 @@ class Client(object):
                 if type == DiffbotApi.CRAWL:
                     endpoint+=type+"/data"
                 endpoint+=type
+            # the request parameters are a copy of the client's ones, so requests can run concurrently
+            params = dict(self._params)
             if param:
                 for key, value in param:
-                    self._params.update({key : value})
+                    params.update({key : value})
             if data:
                 for key, value in data.items():
-                    self._params.update({key: value})
-            self._params.update({'url': url})
+                    params.update({key: value})
+            params.update({'url': url})
 
-            Client.DEBUG_HTTPGET_COUNT = Client.DEBUG_HTTPGET_COUNT + 1
-            logging.debug("HTTP GET Count={}".format(Client.DEBUG_HTTPGET_COUNT))
+            Client._count_http_get()
 
-            request = Client._https_session.get(endpoint, params=self._params)
-            content = json.loads(request.content)
+            body = Client._get(endpoint, params)
+            content = json.loads(body)
             if 'error' in content:
                 self._error = content['error'];
                 self._error_code = content['errorCode']
-            response =  Content(content)
+            response =  Content(content, len(body))
             self._docsInCollection = response.docsInCollection()
             self._query_info = response.query_info()
             return response
+        except MissingFixtureError:
+            raise
         except:
             logging.warning("Response failed. For more info about this error, check the logs")
 
@@ -37,13 +37,15 @@ class Content(object):
     """
     Stores and creates objects from the response retrieved from a request to the Diffbot server
     """
-    def __init__(self, content):
+    def __init__(self, content, size=0):
         """
         Constructor
         :param content: the response
+        :param size: the size of the response in bytes
         """
         self._content = content
         self._nextPage = 0
+        self._size = size
 
     def print_content(self):
         """
@@ -102,6 +104,13 @@ class Content(object):
         """
         return self.objects()[object_index]
 
+    def size(self):
+        """
+
+        :return: the size of the response in bytes
+        """
+        return self._size
+
     def hits(self):
         """
 
@@ -0,0 +1,309 @@
+"""
+Local stand-in for the Diffbot and Google KG APIs, for load and concurrency testing of the data source clients without
+spending API quota.
+
+It answers Diffbot search (/v3/search), article (/v3/article) and KG DQL (/kg/dql_endpoint) requests and Google KG
+search (/v1/entities:search) requests with the response shapes of the real APIs, from a fixture corpus of Diffbot
+article objects. Every response is delayed by a latency drawn from the configured distribution, a fraction of the
+requests can be answered with server errors, and requests above the rate limit get 429 (rate limited) responses.
+
+Search queries get the corpus documents containing their terms. Queries matching no document (any query when the
+corpus is the synthetic one) get a deterministic selection of RESULTS_PER_QUERY documents, so that every query has
+results and different queries share some of them.
+
+Package: fqakg
+
+Usage:
+    python3 -m data_source.stub_server --port=8900 [--corpus=corpus.json] [--latency=100-400] [--error-rate=0.05]
+                                       [--rate-limit=20]
+    python3 module_run.py --module=3 --question="How tall is Mount McKinley?" --ds=dkg --ds-api-key=stub \
+                          --ds-endpoint=http://127.0.0.1:8900
+
+    server = StubServer(latency=300).start()
+    Client.set_end_point(server.url())
+    ...
+    server.stop()
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from qa_logging import get_logger
+
+logger = get_logger("DSOEM.StubServer")
+
+
+def synthetic_corpus(size=200):
+    """
+    :param size: number of documents
+    :return: list of English Diffbot article objects, one in three of them without valid text (a list of short items)
+    """
+    corpus = []
+    for n in range(size):
+        if n % 3 == 2:
+            text = "\n".join("item {}".format(p) for p in range(10))
+        else:
+            text = "\n".join("document {} paragraph {} about topic {}".format(n, p, n % 7) for p in range(5))
+        corpus.append({'type': 'article', 'humanLanguage': 'en', 'title': "Document {}".format(n), 'text': text,
+                       'pageUrl': "https://www.stub.test/doc{}".format(n),
+                       'tags': [{'label': "Topic {}".format(n % 7), 'uri': "https://www.stub.test/topic{}".format(n % 7),
+                                 'score': 0.5 + (n % 5) / 10, 'count': 1}]})
+    return corpus
+
+
+def load_corpus(path):
+    """
+    :param path: JSON file with a list of Diffbot article objects, or a Diffbot search response
+    :return: list of Diffbot article objects
+    """
+    with open(path, encoding='utf-8') as f:
+        corpus = json.load(f)
+    if isinstance(corpus, dict):
+        corpus = corpus.get('data', [])
+    return corpus
+
+
+def parse_latency(latency):
+    """
+    :param latency: None (no latency), a number of milliseconds, "min-max" milliseconds drawn uniformly, or
+                    "lognormal:median:sigma" with the median in milliseconds
+    :return: function drawing a latency in seconds from the given random generator
+    """
+    if latency is None:
+        return lambda rng: 0.0
+    latency = str(latency)
+    if latency.startswith("lognormal:"):
+        median, sigma = latency[len("lognormal:"):].split(":")
+        mu = math.log(float(median) / 1000)
+        return lambda rng: rng.lognormvariate(mu, float(sigma))
+    if "-" in latency:
+        low, high = latency.split("-", 1)
+        return lambda rng: rng.uniform(float(low), float(high)) / 1000
+    return lambda rng: float(latency) / 1000
+
+
+class StubServer(object):
+    """
+    HTTP server answering the data source clients' requests from a fixture corpus
+    """
+    ##############################################################
+    # CONFIGURABLE PARAMETERS
+    ##############################################################
+    # number of results of queries matching no corpus document
+    RESULTS_PER_QUERY = 40
+    # number of results of search requests without a num parameter
+    DEFAULT_NUM_RESULTS = 20
+    ##############################################################
+
+    SEARCH = "/v3/search"
+    ARTICLE = "/v3/article"
+    KG_DQL = "/kg/dql_endpoint"
+    KG_SEARCH = "/v1/entities:search"
+
+    def __init__(self, corpus=None, latency=None, error_rate=0.0, rate_limit=None, port=0, seed=0):
+        """
+        :param corpus: list of Diffbot article objects, the synthetic corpus if None
+        :param latency: latency of the responses (see parse_latency)
+        :param error_rate: fraction of the requests answered with a server error
+        :param rate_limit: number of requests per second answered, the others get 429 responses. No limit if None
+        :param port: port to listen on, any free port if 0
+        :param seed: seed of the latency and error draws
+        """
+        self._corpus = corpus if corpus is not None else synthetic_corpus()
+        self._by_url = {document.get('pageUrl'): document for document in self._corpus}
+        self._texts = [(document.get('title', "") + "\n" + document.get('text', "")).lower()
+                       for document in self._corpus]
+        self._latency = parse_latency(latency)
+        self._error_rate = error_rate
+        self._rate_limit = rate_limit
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = rate_limit
+        self._refilled = time.monotonic()
+        self._stats = {}
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+
+    def start(self):
+        """
+            serves the requests on a background thread
+        :return: the server
+        """
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def url(self):
+        """
+        :return: URL of the server, to be set as the end point of the clients
+        """
+        return "http://127.0.0.1:{}".format(self._server.server_port)
+
+    def stats(self):
+        """
+        :return: dict of the number of requests, server errors and rate limited requests per path
+        """
+        with self._lock:
+            return {path: dict(counts) for path, counts in self._stats.items()}
+
+    def _count(self, path, outcome):
+        with self._lock:
+            counts = self._stats.setdefault(path, {'requests': 0, 'errors': 0, 'rate_limited': 0})
+            counts['requests'] += 1
+            if outcome is not None:
+                counts[outcome] += 1
+
+    def _admit(self):
+        """
+            draws the outcome and latency of a request
+        :return: (None, 'errors' or 'rate_limited', latency in seconds)
+        """
+        with self._lock:
+            latency = self._latency(self._random)
+            if self._rate_limit is not None:
+                now = time.monotonic()
+                self._tokens = min(self._rate_limit, self._tokens + (now - self._refilled) * self._rate_limit)
+                self._refilled = now
+                if self._tokens < 1:
+                    return 'rate_limited', latency
+                self._tokens -= 1
+            if self._random.random() < self._error_rate:
+                return 'errors', latency
+            return None, latency
+
+    @staticmethod
+    def _terms(query):
+        """
+        :return: the quoted terms of a Diffbot query, or its words if none is quoted, lower case
+        """
+        terms = [double or single for double, single in re.findall(r'"([^"]+)"|\'([^\']+)\'', query)]
+        if len(terms) == 0:
+            terms = [term for term in query.split() if ":" not in term]
+        return [term.lower() for term in terms]
+
+    def _matches(self, query):
+        """
+        :return: the corpus documents of a query
+        """
+        terms = StubServer._terms(query)
+        matches = [document for document, text in zip(self._corpus, self._texts)
+                   if len(terms) > 0 and all(term in text for term in terms)]
+        if len(matches) > 0 or len(self._corpus) == 0:
+            return matches
+
+        first = int(hashlib.md5(query.encode('utf-8')).hexdigest(), 16) % len(self._corpus)
+        return [self._corpus[(first + i) % len(self._corpus)]
+                for i in range(min(StubServer.RESULTS_PER_QUERY, len(self._corpus)))]
+
+    def search(self, params):
+        query = params.get('query', "")
+        start = int(params.get('start') or 0)
+        num = int(params.get('num') or StubServer.DEFAULT_NUM_RESULTS)
+        matches = self._matches(query)
+        return 200, {'hits': len(matches), 'num': num, 'start': start, 'data': matches[start:start + num]}
+
+    def article(self, params):
+        url = params.get('url', "")
+        document = self._by_url.get(url)
+        if document is None:
+            document = {'type': 'article', 'humanLanguage': 'en', 'title': url, 'pageUrl': url,
+                        'text': "\n".join("article {} paragraph {}".format(url, p) for p in range(5))}
+        return 200, {'request': {'pageUrl': url, 'api': 'article'}, 'objects': [document]}
+
+    def kg_dql(self, params):
+        query = params.get('query', "")
+        entity_type = re.search(r'type:(\S+)', query)
+        entity_type = entity_type.group(1) if entity_type else "Thing"
+        name = re.search(r'allNames:"([^"]*)"', query)
+        name = name.group(1) if name else ""
+        entity = {'type': entity_type, 'name': name, 'allNames': [name],
+                  'description': "{} is a {} of the stub knowledge graph".format(name, entity_type.lower()),
+                  'diffbotUri': "https://www.stub.test/entity/{}".format(hashlib.md5(name.encode('utf-8')).hexdigest())}
+        return 200, {'hits': 1, 'data': [entity]}
+
+    def kg_search(self, params):
+        limit = int(params.get('limit') or 10)
+        elements = []
+        for rank, document in enumerate(self._matches(params.get('query', ""))[:limit]):
+            elements.append({'@type': "EntitySearchResult", 'resultScore': float(limit - rank),
+                             'result': {'@id': document.get('pageUrl'), 'name': document.get('title', ""),
+                                        '@type': ["Thing"], 'description': document.get('title', ""),
+                                        'detailedDescription': {'articleBody': document.get('text', "").split("\n")[0],
+                                                                'url': document.get('pageUrl')}}})
+        return 200, {'@type': "ItemList", 'itemListElement': elements}
+
+    def _handler(self):
+        stub = self
+        routes = {StubServer.SEARCH: self.search, StubServer.ARTICLE: self.article,
+                  StubServer.KG_DQL: self.kg_dql, StubServer.KG_SEARCH: self.kg_search}
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {name: values[0] for name, values in parse_qs(url.query).items()}
+                route = routes.get(url.path)
+                outcome, latency = stub._admit()
+                stub._count(url.path, outcome)
+                time.sleep(latency)
+
+                if route is None:
+                    status, content = 404, {'errorCode': 404, 'error': "Unknown API {}".format(url.path)}
+                elif outcome == 'rate_limited':
+                    status, content = 429, {'errorCode': 429, 'error': "Too many requests"}
+                elif outcome == 'errors':
+                    status, content = 500, {'errorCode': 500, 'error': "Internal server error"}
+                else:
+                    status, content = route(params)
+                if status != 200 and url.path == StubServer.KG_SEARCH:
+                    content = {'error': {'code': status, 'message': content['error']}}
+
+                body = json.dumps(content).encode('utf-8')
+                self.send_response(status)
+                if status == 429:
+                    self.send_header("Retry-After", "1")
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    from qa_logging import configure_logging
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', dest='port', required=False, type=int, default=8900, help="Port to listen on (default 8900)")
+    parser.add_argument('--corpus', dest='corpus', required=False, help="JSON file with a list of Diffbot article objects, a synthetic corpus by default")
+    parser.add_argument('--latency', dest='latency', required=False, help="Response latency: milliseconds, 'min-max' milliseconds drawn uniformly or 'lognormal:median:sigma' (default none)")
+    parser.add_argument('--error-rate', dest='error_rate', required=False, type=float, default=0.0, help="Fraction of the requests answered with a server error")
+    parser.add_argument('--rate-limit', dest='rate_limit', required=False, type=float, help="Requests per second answered, the others get 429 responses")
+    args = parser.parse_args()
+
+    configure_logging(level="info")
+    server = StubServer(load_corpus(args.corpus) if args.corpus else None, args.latency, args.error_rate,
+                        args.rate_limit, args.port)
+    logger.info("Serving on %s", server.url())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    for path, counts in sorted(server.stats().items()):
+        logger.info("%s: %s requests, %s errors, %s rate limited", path, counts['requests'], counts['errors'],
+                    counts['rate_limited'])
@@ -8,11 +8,24 @@ parser.add_argument('--factoid-pipeline', dest='factoid_pipeline', action='store
 parser.add_argument('--enable-stats', dest='enable_stats', action='store_true', help="Enable stats collection")
 """
 parser.add_argument('--module', dest='module', required=True, help="Module to run (1, 2, 3, 4)")
-parser.add_argument('--question', dest='question', required=True, help="any question you want to ask")
-parser.add_argument('--ds', dest='ds', required=False, help="Specify data source, choices are 'gkg' for Google KG or 'dkg' for Diffbot KG")
+parser.add_argument('--question', dest='question', required=False, help="any question you want to ask")
+parser.add_argument('--questions', dest='questions', required=False, help="Batch mode (module 1 only): file with one question per line (JSON object, question<TAB>answer or plain text), or '-' for stdin")
+parser.add_argument('--output', dest='output', required=False, default="-", help="Batch mode: file the JSON results are written to, one per line, or '-' for stdout (default)")
+parser.add_argument('--ds', dest='ds', required=False, help="Specify data source, choices are 'gkg' for Google KG, 'dkg' for Diffbot KG or 'replay' to serve the responses recorded in --fixtures")
 parser.add_argument('--ds-api-key', dest='ds_api_key', required=False, help="Specify API key/token for the given data source")
+parser.add_argument('--ds-endpoint', dest='ds_endpoint', required=False, help="URL of a server standing in for the data source APIs, e.g. the stub server (python3 -m data_source.stub_server)")
+parser.add_argument('--record', dest='record', action='store_true', help="Record the data source responses to the --fixtures bundle")
+parser.add_argument('--fixtures', dest='fixtures', required=False, default="fixtures.json", help="Fixture bundle recorded with --record and replayed with --ds=replay (default fixtures.json)")
+parser.add_argument('--ds-latency', dest='ds_latency', required=False, help="Replay latency: milliseconds, 'min-max' milliseconds drawn uniformly, or 'recorded' (default none)")
+parser.add_argument('--near-duplicates', dest='near_duplicates', required=False, type=float, help="Drop the DSOEM objects whose text is a near duplicate of an object collected before, e.g. 0.95: fraction of the SimHash fingerprint bits near duplicates agree on (default off)")
+parser.add_argument('--tagger', dest='tagger', required=False, help="POS/NER tagger backend, choices are 'stanford-server' (default), 'stanford' or 'nltk'")
+parser.add_argument('--quiet', dest='quiet', action='store_true', help="Do not log to the console")
+parser.add_argument('--log-level', dest='log_level', required=False, default="info", help="Lowest level logged, choices are 'debug', 'info' (default), 'warning', 'error' or 'off'")
+parser.add_argument('--log-json', dest='log_json', required=False, help="Append log records as JSON lines to the given file")
 
 args = parser.parse_args()
+if args.question is None and args.questions is None:
+    parser.error("one of --question or --questions is required")
 #Config.collect_stats = args.enable_stats
 
 #from test_utils import *
@@ -21,8 +34,58 @@ from QPM import QPM
 from FMQFM import FMQFM
 from DSOEM import DSOEM
 from FAESM import FAESM
+from qa_utils import KGQAPOSTagger
+from qa_logging import configure_logging
 
-if args.module.upper() == "1":
+# batch results written to stdout are not mixed with console logging
+quiet = args.quiet or (args.questions is not None and args.output == "-")
+
+# --quiet without a JSON log silences logging completely
+configure_logging("off" if quiet and args.log_json is None else args.log_level,
+                  console=not quiet,
+                  json_path=args.log_json)
+
+if args.tagger is not None:
+    KGQAPOSTagger.BACKEND = args.tagger
+
+if args.near_duplicates is not None:
+    DSOEM.NEAR_DUPLICATE_SIMILARITY = args.near_duplicates
+
+if args.ds_endpoint is not None:
+    from data_source.sfsu_diffbot.client import Client
+    from data_source.google_kg_client.GKGAPI import GKGAPI
+    Client.set_end_point(args.ds_endpoint)
+    GKGAPI.set_end_point(args.ds_endpoint)
+
+# record or replay the data source requests of modules 3 and 4
+transport = None
+if args.ds == "replay" or args.record:
+    from data_source.fixtures import FixtureTransport
+    if args.ds == "replay":
+        transport = FixtureTransport(args.fixtures, FixtureTransport.REPLAY, latency=args.ds_latency)
+        if transport.data_source() is None:
+            raise Exception("fixture bundle {} doesn't specify its data source".format(args.fixtures))
+        # responses are served from the bundle, no credentials needed
+        args.ds = transport.data_source()
+        args.ds_api_key = args.ds_api_key or "replay"
+    else:
+        transport = FixtureTransport(args.fixtures, FixtureTransport.RECORD, data_source=args.ds)
+    FixtureTransport.install(transport)
+
+if args.questions is not None:
+    # pre-process all questions in this process, writing the results as they are produced
+    if args.module.upper() != "1":
+        raise Exception("batch mode (--questions) is supported for module 1 only")
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        for result in QPM.stream_results(QPM.read_questions(args.questions)):
+            output.write(result.to_json() + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+elif args.module.upper() == "1":
     # instantiate first module of the pipeline: QPM
     qpm = QPM(args.question)
 
@@ -51,8 +114,12 @@ elif args.module.upper() == "4":
 
     qpm = QPM(args.question)
     fmqfm = FMQFM(qpm)
-    dsoem = DSOEM(fmqfm, args.ds, args.ds_api_key, qpm)
+    # FAESM scores the objects as DSOEM collects them
+    dsoem = DSOEM(fmqfm, args.ds, args.ds_api_key, qpm, stream=True)
     faesm = FAESM(dsoem)
     answers = faesm.top_answers()
 else:
-    print("Unrecognized module")
\ No newline at end of file
+    print("Unrecognized module")
+
+if transport is not None:
+    transport.save()
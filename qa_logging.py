@@ -0,0 +1,198 @@
+"""
+Leveled logging of the FQAKG pipeline modules, built on the standard logging package.
+
+Messages are formatted lazily (logging %-style arguments), so records below the configured level, or with no sink
+configured, cost no string formatting. Sinks are the colored console (default) and buffered JSON lines files.
+
+Package: fqakg
+
+"""
+import json
+import logging
+import sys
+
+from colorama import init
+init() # colorama needed for Windows
+from colorama import Style
+
+ROOT_LOGGER = "fqakg"
+
+# level that no record reaches, used to silence all logging
+SILENT = logging.CRITICAL + 10
+
+LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+    "off": SILENT,
+}
+
+# JSON lines records buffered before a write to the JSON log file
+JSON_BUFFER_SIZE = 1000
+
+
+class Highlight(object):
+    """
+    Log message argument shown bright (in the given color) on the console, and as plain text by other sinks
+    """
+    __slots__ = ("value", "color")
+
+    def __init__(self, value, color=""):
+        self.value = value
+        self.color = color
+
+    def __str__(self):
+        return str(self.value)
+
+    def colored(self):
+        return "{}{}{}{}".format(self.color, Style.BRIGHT, self.value, Style.RESET_ALL)
+
+
+class HighlightTags(object):
+    """
+    Log message argument with (token, tag) pairs shown as "token(TAG) ", with highlighted tokens on the console
+    """
+    __slots__ = ("tagged", "color")
+
+    def __init__(self, tagged, color=""):
+        self.tagged = tagged
+        self.color = color
+
+    def __str__(self):
+        return "".join("{}({}) ".format(t[0], t[1]) for t in self.tagged)
+
+    def colored(self):
+        return "".join("{}({}) ".format(Highlight(t[0], self.color).colored(), t[1]) for t in self.tagged)
+
+
+def _module_name(record):
+    """
+    :return: pipeline module of the record's logger, e.g. DSOEM for fqakg.DSOEM.GKGAPI
+    """
+    parts = record.name.split(".")
+    return parts[1] if len(parts) > 1 else parts[0]
+
+
+class ConsoleFormatter(logging.Formatter):
+    """
+    formats records as "[MODULE] message", with Highlight arguments colored
+    """
+
+    def format(self, record):
+        args = record.args
+        if isinstance(args, tuple) and args:
+            message = str(record.msg) % tuple(a.colored() if isinstance(a, (Highlight, HighlightTags)) else a
+                                              for a in args)
+        else:
+            message = record.getMessage()
+        return "[{}] {}".format(_module_name(record), message)
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    formats records as one JSON object per line
+    """
+
+    def format(self, record):
+        return json.dumps({"time": record.created,
+                           "level": record.levelname,
+                           "module": _module_name(record),
+                           "logger": record.name,
+                           "message": record.getMessage()})
+
+
+class ConsoleHandler(logging.StreamHandler):
+    """
+    writes to the current sys.stdout (like print), so redirecting stdout also redirects the console log
+    """
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class JSONLinesHandler(logging.Handler):
+    """
+    appends records to a JSON lines file, writing buffer_size records at a time (errors are written immediately)
+    """
+
+    def __init__(self, path, buffer_size=JSON_BUFFER_SIZE):
+        super(JSONLinesHandler, self).__init__()
+        self.setFormatter(JSONFormatter())
+        self._file = open(path, "a", encoding="utf-8")
+        self._buffer = []
+        self._buffer_size = buffer_size
+
+    def emit(self, record):
+        try:
+            # format now, arguments may be mutated before the buffer is written
+            self._buffer.append(self.format(record))
+            if len(self._buffer) >= self._buffer_size or record.levelno >= logging.ERROR:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self._buffer and self._file is not None:
+                self._file.write("\n".join(self._buffer) + "\n")
+                self._file.flush()
+            self._buffer = []
+        finally:
+            self.release()
+
+    def close(self):
+        self.acquire()
+        try:
+            self.flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        finally:
+            self.release()
+        super(JSONLinesHandler, self).close()
+
+
+def get_logger(name):
+    """
+    :param name: pipeline module name, e.g. QPM, or DSOEM.GKGAPI for a component of a module
+    :return: logger of the module
+    """
+    return logging.getLogger("{}.{}".format(ROOT_LOGGER, name))
+
+
+def configure_logging(level="info", console=True, json_path=None, json_buffer_size=JSON_BUFFER_SIZE):
+    """
+        (re)configures the sinks of the pipeline loggers
+    :param level: lowest level logged, one of LEVELS ("off" silences all logging)
+    :param console: log colored text to stdout
+    :param json_path: optional path of a JSON lines file the records are appended to
+    :param json_buffer_size: number of JSON lines buffered between writes
+    :return: None
+    """
+    if level not in LEVELS:
+        raise Exception("Unrecognized log level {}, choices are {}".format(level, ", ".join(LEVELS)))
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.propagate = False
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+    if console:
+        handler = ConsoleHandler()
+        handler.setFormatter(ConsoleFormatter())
+        root.addHandler(handler)
+    if json_path is not None:
+        root.addHandler(JSONLinesHandler(json_path, json_buffer_size))
+
+    root.setLevel(LEVELS[level] if root.handlers else SILENT)
+
+
+configure_logging()
@@ -0,0 +1,74 @@
+"""
+Stop-word lexicons shared by the modules of the pipeline. Each lexicon is built from the nltk stopwords corpus
+once, on first use, and handed out as a shared frozenset
+
+Package: fqakg
+
+"""
+import threading
+
+from nltk.corpus import stopwords
+
+# extra stop words of user questions
+QUESTION_STOP_WORDS = ('Where', 'Who', 'Whose', 'What', 'Why', 'How', 'and', 'I', 'A', 'And', 'So', 'arnt', 'This',
+                       'When', 'It', 'many', 'Many', 'so', 'cant',
+                       'Yes', 'yes', 'No', 'no', 'These', 'these', 'is', 'are', 'Do', "Are", "About", "For", "Is", "\"")
+
+# extra stop words of search queries, note the missing comma after 'whom' which makes it 'whomYes'
+QUERY_STOP_WORDS = ('Where', 'Who', 'Whose', 'What', 'Why', 'How', 'and', 'I', 'A', 'And', 'So', 'arnt', 'This',
+                    'When', 'It', 'many', 'Many', 'so', 'cant', 'whom'
+                    'Yes', 'yes', 'No', 'no', 'These', 'these', 'is', 'are', 'Do', "Are", "About", "For", "Is", "\"")
+
+# extra stop words of (lower-cased) answer tokens
+ANSWER_STOP_WORDS = ('where', 'who', 'whose', 'what', 'why', 'how', 'and', 'i', 'a', 'and', 'so', 'arnt', 'this',
+                     'when', 'it', 'many', 'many', 'so', 'cant',
+                     'yes', 'no', 'these', 'is', 'are', 'do', "about", "for", "is", "\"",
+                     ',', '.', '(', ')', '`', '\"', '\'', '-',)
+
+# corpus stop words that carry meaning in questions and queries
+QUESTION_KEEP_WORDS = ('own', 'too')
+QUERY_KEEP_WORDS = ('own', 'too', 'won', 'in', 'of', 'have', 'has', 'had')
+
+_lexicons = {}
+_lexicons_lock = threading.Lock()
+
+
+def _lexicon(name, extra_words, keep_words=()):
+    """
+    :param name: lexicon name
+    :param extra_words: words added to the nltk english stop words
+    :param keep_words: nltk english stop words removed from the lexicon
+    :return: the shared lexicon, built on the first call
+    """
+    lexicon = _lexicons.get(name)
+    if lexicon is None:
+        with _lexicons_lock:
+            lexicon = _lexicons.get(name)
+            if lexicon is None:
+                words = set(stopwords.words('english'))
+                words.update(extra_words)
+                words.difference_update(keep_words)
+                lexicon = frozenset(words)
+                _lexicons[name] = lexicon
+    return lexicon
+
+
+def question_stop_words():
+    """
+    :return: stop words removed from user questions (QPM)
+    """
+    return _lexicon("question", QUESTION_STOP_WORDS, QUESTION_KEEP_WORDS)
+
+
+def query_stop_words():
+    """
+    :return: stop words removed from search queries (FMQFM)
+    """
+    return _lexicon("query", QUERY_STOP_WORDS, QUERY_KEEP_WORDS)
+
+
+def answer_stop_words():
+    """
+    :return: stop words ignored in lower-cased answer tokens (FAESM error analysis)
+    """
+    return _lexicon("answer", ANSWER_STOP_WORDS)
@@ -7,28 +7,447 @@ Author: Eduard Kegulskiy
 
 """
 
-from nltk.tag import StanfordPOSTagger
-from nltk.tag import StanfordNERTagger
+from nltk.internals import find_binary
 import nltk
 from word2number import w2n
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import atexit
+import json
+import os
 import re
+import socket
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+
+from qa_logging import get_logger
+
+
+class KGQALRUCache:
+    """
+    Thread-safe bounded LRU cache with an optional sqlite file backend, so that entries survive restarts of the
+    process. Keys and values must be JSON serializable (tuples are stored as lists).
+    """
+    def __init__(self, maxsize=10000, path=None, table="cache", namespace=None):
+        """
+        :param maxsize: maximum number of entries kept in memory
+        :param path: optional sqlite file to persist entries to
+        :param table: sqlite table name, allows several caches to share one file
+        :param namespace: optional version of the cached values (e.g. a hash of the code producing them), entries
+                          persisted under a different namespace are stale and purged when the file is opened
+        """
+        self._maxsize = maxsize
+        self._table = table
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS {} (key TEXT PRIMARY KEY, value TEXT)".format(table))
+            if namespace is not None:
+                self._purge_stale(namespace)
+            self._db.commit()
+
+    def get(self, key):
+        """
+        :param key: hashable key
+        :return: cached value or None if the key is not cached
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM {} WHERE key = ?".format(self._table),
+                                       (json.dumps(key),)).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._insert(key, value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        self.put_many([(key, value)])
+
+    def put_many(self, items):
+        """
+        :param items: list of (key, value) tuples
+        :return: None
+        """
+        with self._lock:
+            for key, value in items:
+                self._insert(key, value)
+
+            if self._db is not None and items:
+                self._db.executemany("INSERT OR REPLACE INTO {} (key, value) VALUES (?, ?)".format(self._table),
+                                     [(json.dumps(key), json.dumps(value)) for key, value in items])
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM {}".format(self._table))
+                self._db.commit()
+
+    def stats(self):
+        """
+        :return: dictionary with hit/miss counters and the current size, useful for sizing the cache
+        """
+        with self._lock:
+            return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                    'size': len(self._entries), 'maxsize': self._maxsize}
+
+    def _purge_stale(self, namespace):
+        """
+            deletes the persisted entries if they were stored under another namespace
+        :param namespace: namespace of the entries of this cache
+        :return: None
+        """
+        meta_table = "{}_namespace".format(self._table)
+        self._db.execute("CREATE TABLE IF NOT EXISTS {} (namespace TEXT)".format(meta_table))
+        row = self._db.execute("SELECT namespace FROM {}".format(meta_table)).fetchone()
+        if row is None or row[0] != namespace:
+            self._db.execute("DELETE FROM {}".format(self._table))
+            self._db.execute("DELETE FROM {}".format(meta_table))
+            self._db.execute("INSERT INTO {} (namespace) VALUES (?)".format(meta_table), (namespace,))
+
+    def _insert(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+
+class KGQATaggerServer:
+    """
+    Keeps one warm JVM running a Stanford tagger model and serves tagging requests over a local socket, so the
+    model is loaded only once instead of on every call. Each request is a single line of space separated tokens;
+    the server answers with the tagged line and closes the connection. The JVM is started on first use and
+    restarted if it dies.
+    """
+    HOST = "127.0.0.1"
+    # seconds to wait for the JVM to load the model and start accepting connections
+    STARTUP_TIMEOUT = 120
+    # seconds to wait for a single tagging request
+    REQUEST_TIMEOUT = 60
+    # number of times the JVM is started, on a fresh port each time, before giving up
+    STARTUP_ATTEMPTS = 3
+    # number of characters of the JVM's stderr reported when it fails to start
+    STDERR_TAIL = 2000
+
+    def __init__(self, tagger, server_class, server_args):
+        """
+        :param tagger: NLTK Stanford tagger which provides the jar, model, java options and output parsing
+        :param server_class: java class of the Stanford socket server (MaxentTaggerServer or NERServer)
+        :param server_args: extra command line arguments passed to the server
+        """
+        self._tagger = tagger
+        self._server_class = server_class
+        self._server_args = server_args
+        self._process = None
+        self._port = None
+        self._lock = threading.Lock()
+        atexit.register(self.stop)
+
+    def tag(self, tokens):
+        """
+        :param tokens: list of word tokens
+        :return: list of word-tag tuples
+        """
+        if len(tokens) == 0:
+            return []
+
+        request = " ".join(tokens)
+        try:
+            response = self._request(request)
+        except OSError:
+            # the JVM may have died between requests, restart it and try once more
+            self.stop()
+            response = self._request(request)
+        return self._tagger.parse_output(response, [tokens])[0]
+
+    def stop(self):
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                self._process.terminate()
+                try:
+                    self._process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    self._process.kill()
+            self._process = None
+
+    def _request(self, text):
+        port = self._ensure_started()
+        encoding = self._tagger._encoding
+        with socket.create_connection((KGQATaggerServer.HOST, port), timeout=KGQATaggerServer.REQUEST_TIMEOUT) as conn:
+            conn.sendall((text + "\n").encode(encoding))
+            conn.shutdown(socket.SHUT_WR)
+            chunks = []
+            while True:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        return b"".join(chunks).decode(encoding)
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._process is None or self._process.poll() is not None:
+                self._start()
+            return self._port
+
+    def _start(self):
+        # the free port is released before the JVM binds it, another process may take it in between. The JVM then
+        # fails to bind and exits, and is started again on a fresh port
+        error = None
+        for attempt in range(KGQATaggerServer.STARTUP_ATTEMPTS):
+            try:
+                self._start_once()
+                return
+            except RuntimeError as e:
+                error = e
+                get_logger("QPM").warning("%s failed to start (attempt %s of %s): %s", self._server_class,
+                                          attempt + 1, KGQATaggerServer.STARTUP_ATTEMPTS, e)
+        raise error
+
+    def _start_once(self):
+        # ask the OS for a free port
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.bind((KGQATaggerServer.HOST, 0))
+            self._port = s.getsockname()[1]
+
+        java_bin = find_binary("java", env_vars=["JAVAHOME", "JAVA_HOME"], binary_names=["java.exe"], verbose=False)
+        cmd = [java_bin] + self._tagger.java_options.split() + ["-cp", self._tagger._stanford_jar, self._server_class]
+        cmd += self._server_args(self._tagger._stanford_model, self._port)
+        # stderr goes to a file rather than a pipe nobody reads, which would block the JVM once full
+        with tempfile.TemporaryFile() as stderr:
+            self._process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=stderr)
+
+            # wait until the model is loaded and the server accepts connections
+            deadline = time.time() + KGQATaggerServer.STARTUP_TIMEOUT
+            while time.time() < deadline:
+                if self._process.poll() is not None:
+                    code = self._process.returncode
+                    self._process = None
+                    raise RuntimeError("{} exited with code {}: {}".format(self._server_class, code,
+                                                                           self._stderr_tail(stderr)))
+                try:
+                    socket.create_connection((KGQATaggerServer.HOST, self._port), timeout=1).close()
+                except OSError:
+                    time.sleep(0.2)
+                    continue
+                # the connection may have been accepted by another process holding the port
+                if self._process.poll() is None:
+                    return
+
+            self._process.kill()
+            self._process = None
+            raise RuntimeError("{} did not start in {} seconds: {}".format(
+                self._server_class, KGQATaggerServer.STARTUP_TIMEOUT, self._stderr_tail(stderr)))
+
+    @staticmethod
+    def _stderr_tail(stderr):
+        """
+        :param stderr: file the JVM's stderr was written to
+        :return: the end of the JVM's stderr
+        """
+        stderr.seek(0)
+        return stderr.read().decode('utf-8', errors='replace')[-KGQATaggerServer.STDERR_TAIL:].strip()
+
+
+class KGQAStanfordBackend:
+    """
+    Stanford Taggers backend (https://www.nltk.org/_modules/nltk/tag/stanford.html). Requires java and the Stanford
+    jars downloaded by setup_env.py
+    """
+    #POS_MODEL = 'stanford-postagger-2018-10-16/models/english-bidirectional-distsim.tagger'
+    POS_MODEL = 'stanford-postagger-2018-10-16/models/english-left3words-distsim.tagger'
+    NER_MODEL = 'stanford-ner-2018-10-16/classifiers/english.all.3class.distsim.crf.ser.gz'
+
+    POS_JAR = 'stanford-postagger-2018-10-16/stanford-postagger.jar'
+    NER_JAR = 'stanford-ner-2018-10-16/stanford-ner.jar'
+
+    # taggers and servers are built on first use (see _load), so importing this module does not locate the jars
+    _POSTagger = None
+    _NERTagger = None
+    _POSServer = None
+    _NERServer = None
+    _load_lock = threading.Lock()
+
+    def __init__(self, persistent=True):
+        """
+        :param persistent: if True, keep one warm JVM per model (see KGQATaggerServer) instead of starting java for
+                           every call
+        """
+        self._persistent = persistent
+
+    @staticmethod
+    def _load():
+        """
+            Builds the Stanford taggers and their servers once, thread-safe
+        :return: None
+        """
+        if KGQAStanfordBackend._NERServer is not None:
+            return
+
+        with KGQAStanfordBackend._load_lock:
+            if KGQAStanfordBackend._NERServer is not None:
+                return
+
+            from nltk.tag import StanfordPOSTagger
+            from nltk.tag import StanfordNERTagger
+
+            pos_tagger = StanfordPOSTagger(
+                model_filename=KGQAStanfordBackend.POS_MODEL,
+                path_to_jar=KGQAStanfordBackend.POS_JAR)
+
+            ner_tagger = StanfordNERTagger(
+                model_filename=KGQAStanfordBackend.NER_MODEL,
+                path_to_jar=KGQAStanfordBackend.NER_JAR,
+                encoding='utf-8')
+
+            KGQAStanfordBackend._POSTagger = pos_tagger
+            KGQAStanfordBackend._NERTagger = ner_tagger
+            KGQAStanfordBackend._POSServer = KGQATaggerServer(
+                pos_tagger,
+                "edu.stanford.nlp.tagger.maxent.MaxentTaggerServer",
+                lambda model, port: ["-model", model, "-port", str(port), "-tokenize", "false", "-encoding", "utf8"])
+            # assigned last, marks the initialization as complete
+            KGQAStanfordBackend._NERServer = KGQATaggerServer(
+                ner_tagger,
+                "edu.stanford.nlp.ie.NERServer",
+                lambda model, port: ["-loadClassifier", model, "-port", str(port), "-outputFormat", "slashTags",
+                                     "-tokenizerFactory", "edu.stanford.nlp.process.WhitespaceTokenizer",
+                                     "-tokenizerOptions", "tokenizeNLs=false", "-encoding", "utf-8"])
+
+    def pos_model(self):
+        return KGQAStanfordBackend.POS_MODEL
+
+    def ner_model(self):
+        return KGQAStanfordBackend.NER_MODEL
+
+    def pos_tag_sents(self, token_lists):
+        """
+        :param token_lists: list of non-empty token lists
+        :return: list of POS-word tuples for each token list
+        """
+        KGQAStanfordBackend._load()
+        if self._persistent:
+            return [KGQAStanfordBackend._POSServer.tag(tokens) for tokens in token_lists]
+        # one java invocation for the whole batch
+        return KGQAStanfordBackend._POSTagger.tag_sents(token_lists)
+
+    def ner_tag_sents(self, token_lists):
+        """
+        :param token_lists: list of non-empty token lists
+        :return: list of NER-word tuples for each token list
+        """
+        KGQAStanfordBackend._load()
+        if self._persistent:
+            return [KGQAStanfordBackend._NERServer.tag(tokens) for tokens in token_lists]
+        return KGQAStanfordBackend._NERTagger.tag_sents(token_lists)
+
+
+class KGQANLTKBackend:
+    """
+    In-process pure-python backend: NLTK's averaged perceptron POS tagger and ne_chunk based NER, whose entity
+    labels are mapped to the PERSON/LOCATION/ORGANIZATION labels of the Stanford 3 class NER model. Requires nltk's
+    averaged_perceptron_tagger, maxent_ne_chunker and words data packages.
+    """
+    NER_LABELS = {
+        'PERSON': 'PERSON',
+        'ORGANIZATION': 'ORGANIZATION',
+        'GPE': 'LOCATION',
+        'GSP': 'LOCATION',
+        'LOCATION': 'LOCATION',
+        'FACILITY': 'LOCATION',
+    }
+
+    def pos_model(self):
+        return "nltk-averaged-perceptron"
+
+    def ner_model(self):
+        return "nltk-maxent-ne-chunker"
+
+    def pos_tag_sents(self, token_lists):
+        return nltk.pos_tag_sents(token_lists)
+
+    def ner_tag_sents(self, token_lists):
+        ner_tags = []
+        for pos_tags in nltk.pos_tag_sents(token_lists):
+            iob_tags = nltk.chunk.tree2conlltags(nltk.ne_chunk(pos_tags))
+            ner_tags.append([(word, self._ner_label(iob)) for word, pos, iob in iob_tags])
+        return ner_tags
+
+    def _ner_label(self, iob):
+        if iob == 'O':
+            return 'O'
+        return KGQANLTKBackend.NER_LABELS.get(iob[2:], 'O')
+
 
 class KGQAPOSTagger:
     """
-    Parts-of-Speech and Named Entity Recognition taggers, based on Stanford Taggers (https://www.nltk.org/_modules/nltk/tag/stanford.html)
+    Parts-of-Speech and Named Entity Recognition taggers, delegating to one of the backends in
+    KGQAPOSTagger.BACKENDS
     """
-    _POSTagger = StanfordPOSTagger(
-        #model_filename='stanford-postagger-2018-10-16/models/english-bidirectional-distsim.tagger',
-        model_filename='stanford-postagger-2018-10-16/models/english-left3words-distsim.tagger',
-        path_to_jar="stanford-postagger-2018-10-16/stanford-postagger.jar")
+    # tagging backend, one of KGQAPOSTagger.BACKENDS
+    BACKEND = "stanford-server"
+    # maximum number of tagged sentences kept in memory
+    TAG_CACHE_SIZE = 10000
+    # optional sqlite file which persists tagged sentences between runs
+    TAG_CACHE_FILE = None
 
-    _NERTagger = StanfordNERTagger(
-        model_filename='stanford-ner-2018-10-16/classifiers/english.all.3class.distsim.crf.ser.gz',
-        path_to_jar='stanford-ner-2018-10-16/stanford-ner.jar',
-        encoding='utf-8')
+    BACKENDS = {
+        # Stanford taggers running in warm JVMs
+        "stanford-server": KGQAStanfordBackend(persistent=True),
+        # Stanford taggers, java is started for every call
+        "stanford": KGQAStanfordBackend(persistent=False),
+        # NLTK taggers, no java required
+        "nltk": KGQANLTKBackend(),
+    }
 
-    def __init__(self):
-        _empty = 0
+    # POS and NER requests of the same sentence are sent concurrently
+    _executor = ThreadPoolExecutor(max_workers=2)
+
+    _cache = None
+    _cache_lock = threading.Lock()
+
+    def __init__(self, backend=None):
+        """
+        :param backend: optional name of the backend to use instead of KGQAPOSTagger.BACKEND
+        """
+        self._backend = KGQAPOSTagger.BACKENDS[backend or KGQAPOSTagger.BACKEND]
+
+    @staticmethod
+    def cache():
+        """
+        :return: tag cache shared by all tagger instances, keyed by model name and token tuple
+        """
+        with KGQAPOSTagger._cache_lock:
+            if KGQAPOSTagger._cache is None:
+                KGQAPOSTagger._cache = KGQALRUCache(KGQAPOSTagger.TAG_CACHE_SIZE, KGQAPOSTagger.TAG_CACHE_FILE, "tags")
+            return KGQAPOSTagger._cache
+
+    @staticmethod
+    def cache_stats():
+        """
+        :return: hit/miss counters of the tag cache
+        """
+        return KGQAPOSTagger.cache().stats()
 
     def tag(self, sentence, ner=True):
         """
@@ -38,16 +457,187 @@ class KGQAPOSTagger:
         :return: list of POS-word tuples and list of NER-word tuples (if ner was set to True)
         """
         if isinstance(sentence, list):
-            pos_tags = KGQAPOSTagger._POSTagger.tag(sentence)
+            tokens = sentence
         else:
-            pos_tags = KGQAPOSTagger._POSTagger.tag(sentence.split())
+            tokens = sentence.split()
+
+        ner_future = None
         if ner:
-            tokens = nltk.tokenize.word_tokenize(sentence)
-            ner_tags = KGQAPOSTagger._NERTagger.tag(tokens)
+            # a sentence given as a token list is tagged as it is, like for POS tagging
+            ner_tokens = tokens if isinstance(sentence, list) else nltk.tokenize.word_tokenize(sentence)
+            ner_future = KGQAPOSTagger._executor.submit(self._ner_tag_sents, [ner_tokens])
+
+        pos_tags = self._pos_tag_sents([tokens])[0]
+        if ner_future is not None:
+            ner_tags = ner_future.result()[0]
         else:
             ner_tags = None
         return pos_tags, ner_tags
 
+    def tag_batch(self, sentences, ner=True):
+        """
+            POS and optional NER tagging of many sentences in a single tagger invocation
+        :param sentences: list of sentences (strings or token lists) to tag
+        :param ner: if True, also perform NER tagging
+        :return: list of (POS-word tuples, NER-word tuples) pairs aligned with the input sentences, NER-word tuples
+                 are None if ner was set to False
+        """
+        token_lists = []
+        for sentence in sentences:
+            if isinstance(sentence, list):
+                token_lists.append(sentence)
+            else:
+                token_lists.append(sentence.split())
+
+        ner_future = None
+        if ner:
+            # sentences given as token lists are tagged as they are, like for POS tagging
+            ner_token_lists = [token_lists[i] if isinstance(sentence, list) else nltk.tokenize.word_tokenize(sentence)
+                               for i, sentence in enumerate(sentences)]
+            ner_future = KGQAPOSTagger._executor.submit(self._ner_tag_sents, ner_token_lists)
+
+        pos_tags = self._pos_tag_sents(token_lists)
+        if ner_future is not None:
+            ner_tags = ner_future.result()
+        else:
+            ner_tags = [None] * len(pos_tags)
+        return list(zip(pos_tags, ner_tags))
+
+    def _pos_tag_sents(self, token_lists):
+        return self._tag_sents(self._backend.pos_model(), self._backend.pos_tag_sents, token_lists)
+
+    def _ner_tag_sents(self, token_lists):
+        return self._tag_sents(self._backend.ner_model(), self._backend.ner_tag_sents, token_lists)
+
+    def _tag_sents(self, model, tag_sents, token_lists):
+        cache = KGQAPOSTagger.cache()
+        tagged = [[] for t in token_lists]
+
+        # only sentences which are not cached are sent to the tagger, each of them once. Empty sentences are not
+        # sent either, they would break alignment of the tagger output
+        pending = OrderedDict()
+        for i, tokens in enumerate(token_lists):
+            if len(tokens) == 0:
+                continue
+            key = (model, tuple(tokens))
+            cached = cache.get(key)
+            if cached is not None:
+                tagged[i] = [tuple(t) for t in cached]
+            else:
+                pending.setdefault(key, []).append(i)
+
+        if not pending:
+            return tagged
+
+        new_tags = tag_sents([list(key[1]) for key in pending])
+        for indexes, tags in zip(pending.values(), new_tags):
+            for i in indexes:
+                tagged[i] = list(tags)
+        cache.put_many([(key, list(tags)) for key, tags in zip(pending, new_tags)])
+        return tagged
+
+
+class KGQAPhraseRewriter:
+    """
+    Replaces phrases of a text according to a table of (phrase, replacement) rules in a single scan. The rules are
+    compiled once into one alternation regex. When several rules match at the same position, the one listed first
+    wins, so the result is the same as applying the rules one after another with str.replace (as long as no
+    replacement creates a new match). A phrase starting with a lower-case letter also matches its capitalized form.
+    """
+    def __init__(self, rules):
+        """
+        :param rules: list of (phrase, replacement) tuples, in order of priority
+        """
+        self._replacements = {}
+        patterns = []
+        for phrase, replacement in rules:
+            variants = [phrase]
+            if phrase[:1].islower():
+                variants.append(phrase[:1].upper() + phrase[1:])
+            for variant in variants:
+                if variant not in self._replacements:
+                    self._replacements[variant] = replacement
+                    patterns.append(re.escape(variant))
+
+        self._regex = re.compile("|".join(patterns))
+
+    def rewrite(self, text):
+        """
+        :param text: text to rewrite
+        :return: text with every phrase replaced
+        """
+        return self._regex.sub(self._replace, text)
+
+    def _replace(self, match):
+        return self._replacements[match.group(0)]
+
+
+class KGQAPastTense:
+    """
+        Past tense (3rd person singular) of verbs, looked up in a precomputed table of verb inflections which is loaded
+        on first use. pattern.en's conjugate, which the table is generated from (see build_past_tense_table.py), is only
+        imported for verbs the table misses
+    """
+    #####################################################################################################
+    # CONFIGURABLE PARAMETERS
+    # tab separated verb inflections: infinitive, 3rd person singular, present participle, past, past participle and
+    # any other forms
+    TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "past_tense_verbs.tsv")
+    #####################################################################################################
+
+    PAST_COLUMN = 3
+
+    _table = None
+    _table_lock = threading.Lock()
+    # whether the missing pattern fallback was logged
+    _fallback_warned = False
+
+    @staticmethod
+    def table():
+        """
+        :return: dictionary of verb form to past tense, shared by all callers
+        """
+        with KGQAPastTense._table_lock:
+            if KGQAPastTense._table is None:
+                infinitives = {}
+                inflections = {}
+                with open(KGQAPastTense.TABLE_FILE, encoding='utf-8') as f:
+                    for line in f:
+                        if line.startswith("#") or line.strip() == "":
+                            continue
+                        # past() looks verbs up in lower case, the lexicon has some capitalized ones ('Africanize')
+                        forms = line.rstrip("\n").lower().split("\t")
+                        infinitives[forms[0]] = forms[KGQAPastTense.PAST_COLUMN]
+                        for form in forms[1:]:
+                            inflections.setdefault(form, forms[KGQAPastTense.PAST_COLUMN])
+
+                # a word which is a verb's infinitive is conjugated as that verb, e.g. 'found' -> 'founded'
+                inflections.update(infinitives)
+                KGQAPastTense._table = inflections
+            return KGQAPastTense._table
+
+    @staticmethod
+    def past(verb):
+        """
+        :param verb: verb in any form
+        :return: past tense of the verb
+        """
+        past = KGQAPastTense.table().get(verb.lower())
+        if past is not None:
+            return past
+
+        try:
+            from pattern.en import conjugate, PAST, SG
+        except ImportError:
+            # no fallback available, keep the verb as it is
+            if not KGQAPastTense._fallback_warned:
+                KGQAPastTense._fallback_warned = True
+                get_logger("FMQFM").warning("'%s' is not in %s and pattern is not installed, verbs missing from the "
+                                            "table are kept as they are", verb, KGQAPastTense.TABLE_FILE)
+            return verb
+        return conjugate(verb=verb, tense=PAST, number=SG)
+
+
 class KGQANumberDetector:
     """
         Detects whether a given text contains a number in either digit form or textual form